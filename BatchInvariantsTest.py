@@ -0,0 +1,48 @@
+import unittest
+from collections import Counter
+
+import batch_invariants
+from count_curves import plane_curves
+
+
+class TestBatchInvariants(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # every curve of up to 4 vertices, of every length at once
+        cls.curves = [c for n in range(5) for c in plane_curves(n)]
+
+    def batches(self):
+        yield batch_invariants.pad_codes(self.curves)
+        yield batch_invariants.pad_codes(c.pack() for c in self.curves)
+
+    def test_num_vertices(self):
+        for _, lengths in self.batches():
+            self.assertEqual([c.num_vertices() for c in self.curves],
+                             batch_invariants.num_vertices(lengths).tolist())
+
+    def test_face_size_histograms(self):
+        for faces, lengths in self.batches():
+            counts = batch_invariants.face_size_histograms(faces, lengths)
+            for c, row in zip(self.curves, counts.tolist()):
+                sizes = Counter(len(refs) for refs in c.face_index().values())
+                self.assertEqual(sizes, Counter(
+                    {k: n for k, n in enumerate(row) if n}), c)
+
+    def test_whitney(self):
+        for faces, lengths in self.batches():
+            self.assertEqual([c.whitney() for c in self.curves],
+                             batch_invariants.whitney(faces, lengths).tolist())
+
+    def test_stable_hash(self):
+        for faces, lengths in self.batches():
+            self.assertEqual(
+                [c.stable_hash() for c in self.curves],
+                batch_invariants.stable_hash(faces, lengths).tolist())
+
+    def test_empty_batch(self):
+        faces, lengths = batch_invariants.pad_codes([])
+        self.assertEqual([], batch_invariants.stable_hash(faces, lengths).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
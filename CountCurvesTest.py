@@ -0,0 +1,24 @@
+import unittest
+from collections import Counter
+
+from count_curves import count_curves, plane_curves
+
+
+class TestCountCurves(unittest.TestCase):
+    def test_totals(self):
+        totals = [sum(count_curves(n).values()) for n in range(6)]
+        self.assertEqual([2, 3, 10, 39, 204, 1262], totals)
+        self.assertEqual(1520, sum(totals))
+
+    def test_by_whitney(self):
+        self.assertEqual({-4: 4, -2: 10, 0: 11, 2: 10, 4: 4}, count_curves(3))
+        for n in range(5):
+            curves = list(plane_curves(n))
+            self.assertEqual(len(curves),
+                             len({c.canonical_key() for c in curves}))
+            self.assertEqual(Counter(c.whitney() for c in curves),
+                             count_curves(n), n)
+
+
+if __name__ == '__main__':
+    unittest.main()
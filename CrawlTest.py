@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import create_db
+import external_bfs
+import sharded_crawl
+from create_db import Budget, Frontier, initialize, insert_curve, iter_curves
+from curve_code import Curve
+from TransferTest import crawl_db, curve_rows, move_rows, stats_rows
+
+
+def explored_keys(c):
+    return {curve.dense_key() for _, _, _, _, curve
+            in iter_curves(c, 'explored = 1')}
+
+
+class TestCrawlEquivalence(unittest.TestCase):
+    """Every other way of crawling gives the serial crawl's database."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.serial = crawl_db(os.path.join(cls.dir.name, 'serial.db'), 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.serial.close()
+        cls.dir.cleanup()
+
+    def assertSameCrawl(self, c):
+        serial = self.serial.cursor()
+        self.assertEqual(curve_rows(c), curve_rows(serial))
+        self.assertEqual(explored_keys(c), explored_keys(serial))
+        self.assertEqual(move_rows(c), move_rows(serial))
+        self.assertEqual(stats_rows(c), stats_rows(serial))
+
+    def test_symmetry_reduced(self):
+        conn = sqlite3.connect(os.path.join(self.dir.name, 'reduced.db'))
+        c = conn.cursor()
+        self.addCleanup(setattr, create_db, 'symmetry_reduced',
+                        create_db.symmetry_reduced)
+        create_db.symmetry_reduced = True
+        initialize(c)
+        insert_curve(c, Curve(Curve.canonical(1)).symmetry_reduced()[0], 0)
+        frontier = Frontier(max_distance=2)
+        frontier.seed(c)
+        create_db.crawl(c, frontier)
+        create_db.symmetry_reduced = False
+
+        full = sqlite3.connect(os.path.join(self.dir.name, 'expanded.db'))
+        create_db.expand_symmetry_reduced(c, full.cursor(), max_distance=2)
+        self.assertSameCrawl(full.cursor())
+        full.close()
+        conn.close()
+
+    def test_pipelined(self):
+        path = os.path.join(self.dir.name, 'pipelined.db')
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        initialize(c)
+        insert_curve(c, Curve(Curve.canonical(1)), 0)
+        conn.commit()
+
+        # stopped partway, and resumed as main() --resume would
+        frontier = Frontier(max_distance=2)
+        frontier.seed(c)
+        budget = Budget(curves=200, check_every=1)
+        reason = create_db.pipelined_crawl(path, frontier, queue_size=4,
+                                           commit_every=16, budget=budget)
+        self.assertIsNotNone(reason)
+        self.assertTrue(list(iter_curves(c, 'explored = 0 AND distance <= 2')))
+
+        create_db.load_counts(c)
+        frontier = Frontier(max_distance=2)
+        frontier.seed(c)
+        self.assertIsNone(create_db.pipelined_crawl(path, frontier,
+                                                    queue_size=4,
+                                                    commit_every=16))
+        self.assertSameCrawl(c)
+        conn.close()
+
+    def test_external_bfs(self):
+        directory = os.path.join(self.dir.name, 'external')
+        # a few records per run, so that each level merges many runs
+        with contextlib.redirect_stdout(io.StringIO()):
+            external_bfs.crawl(directory, max_distance=2, run_size=50)
+        conn = sqlite3.connect(os.path.join(directory, 'loaded.db'))
+        external_bfs.load_database(directory, conn.cursor())
+        self.assertSameCrawl(conn.cursor())
+        conn.close()
+
+    def test_sharded(self):
+        for shards in (2, 3):
+            directory = os.path.join(self.dir.name, f'shards_{shards}')
+            sharded_crawl.crawl(directory, shards, 2)
+            conn = sqlite3.connect(os.path.join(directory, 'merged.db'))
+            sharded_crawl.merge(directory, shards, conn.cursor())
+            self.assertSameCrawl(conn.cursor())
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
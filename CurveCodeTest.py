@@ -1,7 +1,16 @@
 import unittest
-from curve_code import Curve, Move, cw_shift, ccw_shift
+from curve_code import Curve, SphericalCurve, Move, cw_shift, ccw_shift
+from curve_code import SYMMETRIES, MIRROR, REVERSE, CurveSet, CurveMap
+import collections
 import itertools
+import os
+import pickle
 from gauss_code_planarity import planar
+import curve_code
+import face_codec
+import io
+import neighbor_table
+import tempfile
 
 class TestCurveMethods(unittest.TestCase):
     def _check_invariants(self, c: Curve, msg=""):
@@ -192,5 +201,208 @@ class TestCurveMethods(unittest.TestCase):
 
     def test_integrated_neighbors(self):
         for test in self.diverse_test_curves():
-            for move, c in test.neighbors():
+            for move, c in test.generated_neighbors():
                 self._check_invariants(c)
+
+    def test_neighbors_of_moves(self):
+        for test in self.diverse_test_curves():
+            for c in (test, SphericalCurve(test)):
+                every = [(move.value, c2.canonical_key())
+                         for move, c2 in c.generated_neighbors()]
+                for moves in ({Move.R1_CW_ADD},
+                              {Move.J_PLUS_REMOVE, Move.S_1_to_2_CW}):
+                    self.assertEqual(
+                        sorted(n for n in every if Move(n[0]) in moves),
+                        sorted((move.value, c2.canonical_key())
+                               for move, c2 in c.generated_neighbors(moves)))
+
+    def test_canonical_code(self):
+        for test in self.diverse_test_curves():
+            d = test._code.copy()
+            d.rotate(3)
+            self.assertEqual(test.canonical_code(), Curve(d).canonical_code())
+            for (_, c1), (_, c2) in itertools.combinations(
+                    itertools.islice(test.neighbors(), 20), 2):
+                self.assertEqual(c1 == c2,
+                                 c1.canonical_code() == c2.canonical_code())
+
+    def test_plane_curves(self):
+        self.assertEqual(
+            {Curve.canonical(w).canonical_code() for w in (-2, 0, 2)},
+            {c.canonical_code() for c in
+             SphericalCurve(Curve.canonical(2)).plane_curves()}
+        )
+        for test in self.diverse_test_curves():
+            sphere = SphericalCurve(test)
+            planes = list(sphere.plane_curves())
+            self.assertLessEqual(len(planes), len(sphere.face_index()))
+            self.assertIn(test, planes)
+            for c in planes:
+                self._check_invariants(c)
+                self.assertEqual(sphere, SphericalCurve(c))
+                self.assertEqual(hash(sphere), hash(SphericalCurve(c)))
+
+    def test_spherical_neighbors(self):
+        for test in self.diverse_test_curves():
+            sphere = SphericalCurve(test)
+            for move, c in sphere.neighbors():
+                self.assertIsInstance(c, SphericalCurve)
+                self._check_invariants(next(c.plane_curves()))
+
+    def test_small_spherical_neighbors(self):
+        def found(sphere):
+            return sorted((move.value, c.canonical_key())
+                          for move, c in sphere.neighbors())
+
+        circle = SphericalCurve(Curve.canonical(1))
+        eight = SphericalCurve(Curve.canonical(0))
+        self.assertEqual(
+            [(move, c) for move, c in circle.neighbors()
+             if move.value // 100 == 1],
+            [(Move.R1_CCW_ADD, eight), (Move.R1_CW_ADD, eight)])
+        self.assertEqual(
+            sorted(move.value for move, c in eight.neighbors()
+                   if move.value % 2 == 0),
+            [Move.R1_CCW_REMOVE.value, Move.R1_CW_REMOVE.value])
+
+        # every curve of up to two vertices, and their neighbors
+        spheres = {circle}
+        for _ in range(2):
+            spheres |= {c for sphere in spheres
+                        for _, c in sphere.neighbors() if len(c) <= 4}
+        spheres |= {c for sphere in spheres for _, c in sphere.neighbors()}
+        for sphere in spheres:
+            made = collections.Counter(move.value // 100 * 2 - move.value % 2
+                                       for move, _ in sphere.neighbors())
+            sides = [len(refs) for refs in sphere.face_index().values()]
+            self.assertEqual(made[1], 2 * len(sphere), sphere)
+            # the circle's two faces are not loops
+            self.assertEqual(made[2], len(sphere.move_sites()[1])
+                             if len(sphere) > 1 else 0, sphere)
+            self.assertEqual(made[3], sum(p * (p + 1) // 2 for p in sides),
+                             sphere)
+            for plane in sphere.plane_curves():
+                self.assertEqual(found(sphere), found(SphericalCurve(plane)),
+                                 plane)
+
+    def test_symmetry_moves(self):
+        for test in self.test_curves:
+            for g in SYMMETRIES:
+                image_moves = dict()
+                for m, d in test.transformed(g).generated_neighbors():
+                    image_moves.setdefault(d.canonical_code(), []).append(m)
+                for move, c in test.generated_neighbors():
+                    self.assertIn(
+                        move.transformed(g),
+                        image_moves[c.transformed(g).canonical_code()]
+                    )
+
+    def test_symmetry_reduced(self):
+        for test in self.diverse_test_curves():
+            rep, g, stabilizer = test.symmetry_reduced()
+            self.assertEqual(rep, test.transformed(g))
+            self.assertTrue(stabilizer & 1)
+            for h in SYMMETRIES:
+                image = test.transformed(h)
+                self.assertEqual(rep.canonical_code(),
+                                 image.symmetry_reduced()[0].canonical_code())
+                self.assertEqual(bool(stabilizer >> h & 1), image == test)
+        w = Curve.canonical(3).whitney()
+        self.assertEqual(-w, Curve.canonical(3).mirror().whitney())
+        self.assertEqual(w, Curve.canonical(3).transformed(MIRROR | REVERSE).whitney())
+
+    def test_pack(self):
+        for test in self.diverse_test_curves():
+            self.assertEqual(list(test), list(Curve.unpack(test.pack())))
+            self.assertEqual(list(test), list(pickle.loads(pickle.dumps(test))))
+            d = test._code.copy()
+            d.rotate(1)
+            self.assertEqual(test.canonical_key(), Curve(d).canonical_key())
+            self.assertEqual(test, Curve.unpack(test.canonical_key()))
+
+    def test_dense_key(self):
+        keys = []
+        for test in self.diverse_test_curves():
+            d = test._code.copy()
+            d.rotate(1)
+            key = test.dense_key()
+            self.assertEqual(key, Curve(d).dense_key())
+            self.assertEqual(test, Curve.from_dense_key(key))
+            labels = [face for pair in test.dense_code() for face in pair]
+            self.assertEqual(set(range(max(labels) + 1)), set(labels))
+            keys.append(key)
+        decoded = face_codec.iter_decode(io.BytesIO(b''.join(keys)))
+        self.assertEqual(keys, [face_codec.encode(labels) for labels in decoded])
+
+    def test_neighbor_table(self):
+        saved = curve_code._small_neighbors
+        curve_code._small_neighbors = (2, neighbor_table.build(2))
+        try:
+            for test in self.diverse_test_curves():
+                d = test._code.copy()
+                d.rotate(1)
+                for c in (test, Curve(d)):
+                    for moves in (None, {Move.R1_CW_ADD, Move.J_PLUS_REMOVE}):
+                        looked_up = sorted(
+                            (move.value, c2.canonical_key())
+                            for move, c2 in c.neighbors(moves))
+                        generated = sorted(
+                            (move.value, c2.canonical_key())
+                            for move, c2 in c.generated_neighbors(moves))
+                        self.assertEqual(generated, looked_up, c)
+        finally:
+            curve_code._small_neighbors = saved
+
+        # the table in use, if there is one, matches the generators
+        max_vertices, table = curve_code.small_neighbors()
+        built = neighbor_table.build(min(max_vertices, 3))
+        for key, entries in built.items():
+            self.assertEqual(collections.Counter(entries),
+                             collections.Counter(table[key]))
+
+    def test_stale_neighbor_table(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'table.bin')
+            neighbor_table.write({}, 1, path)
+            with open(path, 'r+b') as f:
+                f.seek(len(neighbor_table.MAGIC))
+                f.write(bytes(4))
+            with self.assertRaises(ValueError):
+                neighbor_table.read(path)
+            with open(path, 'rb') as f:
+                stale = f.read()
+            # not used, and left as it is
+            self.assertEqual((-1, {}), neighbor_table.load(path))
+            with open(path, 'rb') as f:
+                self.assertEqual(stale, f.read())
+            self.assertEqual((-1, {}), neighbor_table.load(path + '.missing'))
+            self.assertEqual(['table.bin'], os.listdir(d))
+
+    def test_curve_set(self):
+        curves = list(self.diverse_test_curves())
+        s = CurveSet(curves)
+        self.assertEqual(len(curves), len(s))
+        for test in curves:
+            d = test._code.copy()
+            d.rotate(1)
+            self.assertIn(Curve(d), s)
+            self.assertEqual(test, Curve.from_dense_key(test.dense_key()))
+        self.assertEqual(0, s.add_many(curves))
+        self.assertNotIn(Curve.canonical(20), s)
+        self.assertEqual(list(s.keys()), list(pickle.loads(pickle.dumps(s)).keys()))
+
+        m = CurveMap((c, i) for i, c in enumerate(curves))
+        m = pickle.loads(pickle.dumps(m))
+        for i, test in enumerate(curves):
+            self.assertEqual(i, m[test])
+        self.assertIsNone(m.get(Curve.canonical(20)))
+
+    def test_stable_hash(self):
+        for test in self.diverse_test_curves():
+            h = test.stable_hash()
+            self.assertTrue(-2 ** 63 <= h < 2 ** 63)
+            self.assertEqual(h, Curve.unpack(test.canonical_key()).stable_hash())
+            d = test._code.copy()
+            d.rotate(3)
+            self.assertEqual(h, Curve(d).stable_hash())
+
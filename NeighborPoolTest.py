@@ -0,0 +1,84 @@
+import gc
+import sys
+import unittest
+from itertools import islice
+from multiprocessing import shared_memory
+
+import CurveCodeTest
+from curve_code import Curve, SphericalCurve, Move
+from neighbor_pool import NeighborPool
+
+
+def serial(curves, moves=None):
+    return [(cid, sorted((move.value, c.canonical_key())
+                         for move, c in curve.neighbors(moves)))
+            for cid, curve in curves]
+
+
+def pooled(pool, curves, cls=Curve, **kwargs):
+    return [(cid, sorted((move.value, cls.unpack(code).canonical_key())
+                         for move, code in neighbors))
+            for cid, neighbors in pool.imap(curves, **kwargs)]
+
+
+class TestNeighborPool(unittest.TestCase):
+    def setUp(self):
+        # errors in generators and finalizers would otherwise only warn
+        unraisable = []
+        saved = sys.unraisablehook
+        sys.unraisablehook = unraisable.append
+
+        def check():
+            gc.collect()
+            sys.unraisablehook = saved
+            self.assertEqual([], [u.exc_value for u in unraisable])
+        self.addCleanup(check)
+
+        tests = CurveCodeTest.TestCurveMethods
+        curves = list(tests.test_curves)
+        curves += [Curve.canonical(w) for w in range(-5, 6)]
+        curves += [c for _, c in islice(tests.test_curve_2.neighbors(), 30)]
+        self.curves = list(enumerate(curves, 1))
+
+    def test_matches_serial(self):
+        expected = serial(self.curves)
+        with NeighborPool(2) as pool:
+            self.assertEqual(expected, pooled(pool, self.curves))
+            # again, in chunks of other sizes
+            self.assertEqual(expected, pooled(pool, self.curves, chunk_size=5))
+
+    def test_items_over_several_slots(self):
+        # a few neighbors per slot, so that items span slots
+        with NeighborPool(3, slots=2, slot_size=1024) as pool:
+            self.assertEqual(serial(self.curves), pooled(pool, self.curves))
+
+    def test_moves_and_class(self):
+        moves = {Move.R1_CW_ADD, Move.J_PLUS_REMOVE, Move.S_1_to_2_CW}
+        spheres = [(cid, SphericalCurve(c)) for cid, c in self.curves]
+        with NeighborPool(2, SphericalCurve, moves=moves) as pool:
+            self.assertEqual(serial(spheres, moves),
+                             pooled(pool, spheres, SphericalCurve))
+
+    def test_unfinished_imap(self):
+        with NeighborPool(2, slots=2, slot_size=1024) as pool:
+            for _ in pool.imap(self.curves, chunk_size=2):
+                break
+            self.assertEqual(serial(self.curves), pooled(pool, self.curves))
+
+    def test_close(self):
+        pool = NeighborPool(2)
+        names = [shm.name for shm in pool._shm]
+        items = pool.imap(self.curves)
+        # hold on to a code from an unfinished imap()
+        _, neighbors = next(items)
+        pool.close()
+        for p in pool._processes:
+            self.assertFalse(p.is_alive())
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+        del items, neighbors
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+from collections import Counter
+
+from count_curves import plane_curves
+from sampling import run_chain
+
+
+class TestSampling(unittest.TestCase):
+    def test_uniform_over_curves(self):
+        curves = {c.canonical_key() for c in plane_curves(2)}
+        samples = Counter(c.canonical_key()
+                          for c in run_chain(2, 1000, seed=1, burn_in=100,
+                                             thin=1))
+        self.assertEqual(curves, set(samples))
+        # successive samples are correlated, so only within a factor of 2
+        mean = 1000 / len(curves)
+        for key, n in samples.items():
+            self.assertTrue(mean / 2 < n < 2 * mean, (key, n))
+
+
+if __name__ == '__main__':
+    unittest.main()
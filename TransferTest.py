@@ -0,0 +1,100 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import create_db
+import transfer
+from create_db import Frontier, initialize, insert_curve, iter_curves
+from curve_code import Curve
+
+
+def crawl_db(path, max_distance):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    initialize(c)
+    insert_curve(c, Curve(Curve.canonical(1)), 0)
+    frontier = Frontier(max_distance=max_distance)
+    frontier.seed(c)
+    create_db.crawl(c, frontier)
+    conn.commit()
+    return conn
+
+
+def curve_rows(c):
+    return {curve.dense_key(): (v, w, d)
+            for _, v, w, d, curve in iter_curves(c)}
+
+
+def move_rows(c):
+    keys = {cid: curve.dense_key() for cid, _, _, _, curve in iter_curves(c)}
+    c.execute("""
+        SELECT start_curve_id, end_curve_id, type_id, multiplicity,
+               inverse_multiplicity
+        FROM move
+    """)
+    return {(keys[a], keys[b], t): (m, im) for a, b, t, m, im in c.fetchall()}
+
+
+def stats_rows(c):
+    c.execute("SELECT num_vertices, distance, count FROM stats")
+    return sorted(c.fetchall())
+
+
+class TestTransfer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.source = crawl_db(os.path.join(cls.dir.name, 'source.db'), 2)
+        cls.exported = os.path.join(cls.dir.name, 'curves.bin')
+        transfer.export_curves(cls.source.cursor(), cls.exported)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.source.close()
+        cls.dir.cleanup()
+
+    def test_round_trip_empty(self):
+        conn = sqlite3.connect(os.path.join(self.dir.name, 'empty.db'))
+        c = conn.cursor()
+        initialize(c)
+        inserted, merged = transfer.import_curves(c, self.exported)
+        source = self.source.cursor()
+        self.assertEqual((inserted, merged), (len(curve_rows(source)), 0))
+        self.assertEqual(curve_rows(c), curve_rows(source))
+        self.assertEqual(stats_rows(c), stats_rows(source))
+        # only curves travel
+        self.assertEqual(move_rows(c), {})
+        conn.close()
+
+    def test_round_trip_overlapping(self):
+        conn = crawl_db(os.path.join(self.dir.name, 'overlap.db'), 1)
+        c = conn.cursor()
+        moves = move_rows(c)
+        explored = len(list(iter_curves(c, 'explored = 1')))
+
+        # every curve one further than in the source, so that the import
+        # below lowers the distance of all but the overlap
+        farther = os.path.join(self.dir.name, 'farther.jsonl')
+        with open(farther, 'w') as f:
+            for curve, w, d in transfer.read_curves(self.exported):
+                f.write(json.dumps({'code': list(curve), 'whitney': w,
+                                    'distance': d + 1}) + '\n')
+        transfer.import_curves(c, farther)
+        conn.commit()
+
+        # as a fresh process would, with nothing counted in memory
+        create_db.counts.clear()
+        transfer.import_curves(c, self.exported)
+        source = self.source.cursor()
+        self.assertEqual(curve_rows(c), curve_rows(source))
+        self.assertEqual(stats_rows(c), stats_rows(source))
+        self.assertEqual(move_rows(c), moves)
+        self.assertLessEqual(moves.keys(), move_rows(source).keys())
+        self.assertEqual(len(list(iter_curves(c, 'explored = 1'))), explored)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
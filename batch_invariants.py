@@ -0,0 +1,193 @@
+"""Curve invariants for a whole batch of codes at once, with NumPy.
+
+A batch is a (B, L, 2) int32 array of faces, row b holding the left and
+right faces of its lengths[b] edges and then PAD. pad_codes() builds one
+from curves or pack() bytes, and iter_batches() reads them from a
+database. Each function returns one value (or row) per curve, equal to
+what the Curve method of the same name gives.
+
+    python batch_invariants.py ipc.db [--batch-size 100000]
+
+fills a stable_hash column with Curve.stable_hash() of every curve.
+"""
+import argparse
+import sqlite3
+
+import numpy as np
+
+from curve_code import Curve
+
+PAD = -2
+
+
+def pad_codes(codes):
+    """The (faces, lengths) batch of some curves or packed codes."""
+    arrays = [
+        np.frombuffer(code.pack() if isinstance(code, Curve) else code,
+                      dtype=np.int32).reshape(-1, 2)
+        for code in codes
+    ]
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    faces = np.full((len(arrays), lengths.max(initial=0), 2), PAD, np.int32)
+    if arrays:
+        faces[_valid(lengths, faces.shape[1])] = np.concatenate(arrays)
+    return faces, lengths
+
+
+def iter_batches(c, batch_size=100_000):
+    """Yield (ids, faces, lengths) for every curve in the database."""
+    ids_c = c.connection.cursor()
+    ids_c.execute("SELECT id FROM curve ORDER BY id")
+    while True:
+        ids = np.array(ids_c.fetchmany(batch_size), dtype=np.int64).reshape(-1)
+        if not len(ids):
+            return
+        c.execute("""
+            SELECT curve_id, left_face, right_face FROM curve_edge
+            WHERE curve_id BETWEEN ? AND ?
+            ORDER BY curve_id, position
+        """, (int(ids[0]), int(ids[-1])))
+        edges = np.array(c.fetchall(), dtype=np.int64).reshape(-1, 3)
+        lengths = np.bincount(np.searchsorted(ids, edges[:, 0]),
+                              minlength=len(ids))
+        faces = np.full((len(ids), lengths.max(), 2), PAD, np.int32)
+        faces[_valid(lengths, faces.shape[1])] = edges[:, 1:]
+        yield ids, faces, lengths
+
+
+def _valid(lengths, width):
+    return np.arange(width) < lengths[:, None]
+
+
+def _shifted(values, lengths, k):
+    """values[b, (i - k) % lengths[b]] at [b, i]."""
+    i = np.arange(values.shape[1])
+    index = (i - k) % np.maximum(lengths, 1)[:, None]
+    return np.take_along_axis(values, index, axis=1)
+
+
+def _face_ids(faces, lengths):
+    """Number the faces of the whole batch 0 .. G - 1.
+
+    Returns the (B, L, 2) face numbers (0 for padding), the row of each
+    face, and its label.
+    """
+    valid = np.broadcast_to(_valid(lengths, faces.shape[1])[:, :, None],
+                            faces.shape)
+    rows = np.broadcast_to(np.arange(len(faces))[:, None, None], faces.shape)
+    keys = rows.astype(np.int64) << 32 | (faces.astype(np.int64) & 0xFFFFFFFF)
+    unique, inverse = np.unique(keys[valid], return_inverse=True)
+    ids = np.zeros(faces.shape, dtype=np.int64)
+    ids[valid] = inverse
+    labels = (unique & 0xFFFFFFFF).astype(np.uint32).view(np.int32)
+    return ids, unique >> 32, labels
+
+
+def num_vertices(lengths):
+    return lengths // 2
+
+
+def face_size_histograms(faces, lengths):
+    """counts[b, k] is the number of faces of curve b with k edge sides,
+    the outside included."""
+    ids, face_rows, _ = _face_ids(faces, lengths)
+    valid = _valid(lengths, faces.shape[1])
+    sizes = np.bincount(ids[valid].reshape(-1), minlength=len(face_rows))
+    counts = np.zeros((len(faces), sizes.max(initial=0) + 1), dtype=np.int64)
+    np.add.at(counts, (face_rows, sizes), 1)
+    return counts
+
+
+def whitney(faces, lengths):
+    """The Whitney index of each curve, as Curve.whitney() finds it.
+
+    Each vertex is passed twice, at two quadruples that are cyclic shifts
+    of each other, and contributes +1 or -1 by which shift is met second,
+    reading from the edge after the first one touching the outside.
+    """
+    width = faces.shape[1]
+    valid = _valid(lengths, width)
+    ids, face_rows, _ = _face_ids(faces, lengths)
+    first_id = np.searchsorted(face_rows, np.arange(len(faces)))
+    local = (ids - first_id[:, None, None]).astype(np.uint64)
+
+    x, y = local[:, :, 0], local[:, :, 1]
+    quadruple = (x, y, _shifted(y, lengths, 1), _shifted(x, lengths, 1))
+
+    def encode(a, b, c, d):
+        return a << 48 | b << 32 | c << 16 | d
+
+    a, b, c, d = quadruple
+    code = encode(a, b, c, d)
+    cw = encode(d, a, b, c)
+    vertex = np.minimum(np.minimum(code, cw),
+                        np.minimum(encode(c, d, a, b), encode(b, c, d, a)))
+
+    touches_out = (faces == Curve.OUT).any(axis=2) & valid
+    start = touches_out.argmax(axis=1)
+    rows = np.arange(len(faces))
+    w = np.where(faces[rows, start, 0] == Curve.OUT, -1, 1)
+    order = (np.arange(width) - start[:, None] - 1) % np.maximum(lengths, 1)[:, None]
+
+    row_v, pos_v = np.nonzero(valid)
+    vertex_v = vertex[row_v, pos_v]
+    by_vertex = np.lexsort((vertex_v, row_v))
+    row_v, pos_v, vertex_v = row_v[by_vertex], pos_v[by_vertex], vertex_v[by_vertex]
+    paired = (row_v[:-1] == row_v[1:]) & (vertex_v[:-1] == vertex_v[1:])
+    row_p = row_v[:-1][paired]
+    i, j = pos_v[:-1][paired], pos_v[1:][paired]
+    i_first = order[row_p, i] < order[row_p, j]
+    earlier = np.where(i_first, i, j)
+    later = np.where(i_first, j, i)
+    sign = np.where(cw[row_p, later] == code[row_p, earlier], 1, -1)
+    return w + np.bincount(row_p, weights=sign, minlength=len(faces)).astype(np.int64)
+
+
+def _mix64(z):
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB
+    return z ^ (z >> 31)
+
+
+def stable_hash(faces, lengths):
+    """Curve.stable_hash() of each curve."""
+    valid = _valid(lengths, faces.shape[1])
+    ids, face_rows, labels = _face_ids(faces, lengths)
+    lefts = np.bincount(ids[:, :, 0][valid], minlength=len(face_rows))
+    rights = np.bincount(ids[:, :, 1][valid], minlength=len(face_rows))
+    face_code = _mix64((lefts | rights << 20).astype(np.uint64)
+                       | (labels == Curve.OUT).astype(np.uint64) << 40)
+
+    edge = _mix64(3 * face_code[ids[:, :, 0]] + face_code[ids[:, :, 1]])
+    triple = _mix64(_mix64(_shifted(edge, lengths, 2))
+                    + _shifted(edge, lengths, 1))
+    terms = np.where(valid, _mix64(triple + edge), np.uint64(0))
+    return _mix64(terms.sum(axis=1, dtype=np.uint64)).view(np.int64)
+
+
+def backfill_stable_hash(c, batch_size=100_000):
+    """Add a stable_hash column to the curve table if needed, and fill it."""
+    c.execute("PRAGMA table_info(curve)")
+    if 'stable_hash' not in [column[1] for column in c.fetchall()]:
+        c.execute("ALTER TABLE curve ADD COLUMN stable_hash INTEGER")
+
+    update_c = c.connection.cursor()
+    for ids, faces, lengths in iter_batches(c, batch_size):
+        update_c.executemany("""
+            UPDATE curve SET stable_hash = ? WHERE id = ?
+        """, zip(stable_hash(faces, lengths).tolist(), ids.tolist()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db')
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    backfill_stable_hash(conn.cursor(), args.batch_size)
+    conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Time the Curve hot paths over curated and random curves.
+
+    python benchmark.py                       # print results
+    python benchmark.py --save bench_baseline.json
+    python benchmark.py --compare bench_baseline.json
+
+Results are keyed by operation and vertex count. Each has the median
+seconds per call and the peak bytes allocated by one call.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+from curve_code import Curve, small_neighbors
+from gauss_code_planarity import planar
+
+
+def curated_curves():
+    from CurveCodeTest import TestCurveMethods
+    yield from TestCurveMethods.test_curves
+    for w in range(-5, 6):
+        # the circles have no Gauss code
+        if abs(w) != 1:
+            yield Curve.canonical(w)
+
+
+def random_curve(num_vertices, rng):
+    """Walk up from the circle by random R1 and J additions."""
+    c = Curve.canonical(rng.choice([-1, 1]))
+    while c.num_vertices() < num_vertices:
+        moves = list(c.increasing_r1_neighbors())
+        if c.num_vertices() + 2 <= num_vertices:
+            moves += c.increasing_j_neighbors()
+        _, c = rng.choice(moves)
+    return c
+
+
+def rotated(c):
+    code = deque(c)
+    code.rotate(len(code) // 2)
+    return Curve(code)
+
+
+OPERATIONS = {
+    'neighbors': lambda c: sum(1 for _ in c.generated_neighbors()),
+    # from the neighbor table where the curve is small enough
+    'neighbors_table': lambda c: sum(1 for _ in c.neighbors()),
+    'increasing_r1': lambda c: sum(1 for _ in c.increasing_r1_neighbors()),
+    'decreasing_r1': lambda c: sum(1 for _ in c.decreasing_r1_neighbors()),
+    'increasing_j': lambda c: sum(1 for _ in c.increasing_j_neighbors()),
+    'decreasing_j': lambda c: sum(1 for _ in c.decreasing_j_neighbors()),
+    'strange': lambda c: sum(1 for _ in c.strange_neighbors()),
+    'eq': lambda c: c == rotated(c),
+    # hash() is cached on the curve after its first call
+    'hash': lambda c: c._compute_hash(),
+    'whitney': Curve.whitney,
+    'gauss_code': Curve.gauss_code,
+    'planar': lambda c: planar(c.gauss_code()),
+}
+
+
+def fresh(curves):
+    """Copies of the curves without the face_index() and move_sites()
+    they cache, so that no call finds them worked out by an earlier one."""
+    return [type(c)(c) for c in curves]
+
+
+def time_call(op, curves, repeat):
+    runs = []
+    for _ in range(repeat):
+        copies = fresh(curves)
+        t0 = time.perf_counter()
+        for c in copies:
+            op(c)
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs) / len(curves)
+
+
+def peak_bytes(op, curves):
+    peaks = []
+    tracemalloc.start()
+    for c in fresh(curves):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        op(c)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return max(peaks)
+
+
+def run(sizes, per_size, repeat, seed, operations=OPERATIONS):
+    # read, or rebuilt, once and not timed
+    small_neighbors()
+    rng = random.Random(seed)
+    groups = dict()
+    for c in curated_curves():
+        groups.setdefault(c.num_vertices(), []).append(c)
+    for n in sizes:
+        groups.setdefault(n, []).extend(
+            random_curve(n, rng) for _ in range(per_size))
+
+    results = dict()
+    for n, curves in sorted(groups.items()):
+        for name, op in operations.items():
+            results[f'{name}@{n}'] = {
+                'seconds': time_call(op, curves, repeat),
+                'peak_bytes': peak_bytes(op, curves),
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return (key, old, new) for each operation slower by over threshold."""
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is not None and new['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append((key, old['seconds'], new['seconds']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[2, 4, 6, 8, 10, 12, 16, 20])
+    parser.add_argument('--per-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='fraction slower that counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.per_size, args.repeat, args.seed)
+    for key, r in results.items():
+        print(f"{key:<20} {r['seconds'] * 1e6:12.2f} us  "
+              f"{r['peak_bytes']:10} B")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for key, old, new in regressions:
+            print(f"REGRESSION {key}: {old * 1e6:.2f} us -> {new * 1e6:.2f} us "
+                  f"({new / old - 1:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""A read-only curve catalogue in one memory-mapped file.
+
+Layout:
+
+    header   magic, count, index offset, data offset
+    data     each curve's dense_key()
+    index    one fixed-width entry per curve, sorted by key:
+             key offset, key length, curve id, whitney, distance
+
+The header and index are packed little-endian. Dense keys are a varint
+and little-endian bit fields (see face_codec.py), so the whole file
+reads the same on any machine.
+
+Lookups binary search the index and return memoryviews into the map, so
+every process reading the same file shares the page cache. Those views
+stay readable after close(), which leaves the map to go with them.
+
+    python catalogue.py ipc.db ipc.cat
+"""
+import mmap
+import sqlite3
+import struct
+import sys
+
+from curve_code import Curve
+from create_db import iter_curves
+
+MAGIC = b'IPCCAT02'
+HEADER = struct.Struct('<8sQQQ')
+ENTRY = struct.Struct('<QIqii')
+# stored in place of a NULL whitney index
+NO_WHITNEY = -2 ** 31
+
+
+def export_catalogue(c, path):
+    """Write every curve in the database to a catalogue at path."""
+    entries = []
+    with open(path, 'w+b') as f:
+        f.write(bytes(HEADER.size))
+        offset = HEADER.size
+        for cid, v, w, d, curve in iter_curves(c):
+            key = curve.dense_key()
+            f.write(key)
+            entries.append((offset, len(key), cid,
+                            NO_WHITNEY if w is None else w, d))
+            offset += len(key)
+        f.flush()
+
+        index_offset = offset
+        if entries:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                entries.sort(key=lambda e: mm[e[0]:e[0] + e[1]])
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(entries), index_offset, HEADER.size))
+
+
+class Catalogue:
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        magic, self._count, self._index_offset, _ = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a curve catalogue")
+
+    def close(self):
+        if self._mm is None:
+            return
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # keys from lookup() or key() are still referenced; the
+            # mapping goes when they do
+            pass
+        self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def entry(self, i):
+        """(key offset, key length, curve id, whitney, distance) of entry i."""
+        return ENTRY.unpack_from(self._mm, self._index_offset + i * ENTRY.size)
+
+    def key(self, i):
+        offset, length, *_ = self.entry(i)
+        return self._view[offset:offset + length]
+
+    def find(self, key):
+        """The index of the entry with this key, or -1."""
+        if isinstance(key, Curve):
+            key = key.dense_key()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, *_ = self.entry(mid)
+            mid_key = self._mm[offset:offset + length]
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def lookup(self, curve):
+        """The dense key of a curve equal to this one, or None."""
+        i = self.find(curve)
+        return None if i < 0 else self.key(i)
+
+    def __contains__(self, curve):
+        return self.find(curve) >= 0
+
+    def curve_id(self, curve):
+        i = self.find(curve)
+        return None if i < 0 else self.entry(i)[2]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield Curve.from_dense_key(self.key(i))
+
+
+if __name__ == '__main__':
+    export_catalogue(sqlite3.connect(sys.argv[1]).cursor(), sys.argv[2])
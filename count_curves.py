@@ -0,0 +1,238 @@
+"""Count plane curves by (num_vertices, whitney) without storing them.
+
+A curve with n > 0 vertices, read from a chosen starting edge, is a
+signed Gauss word: the 2n passages through crossings in order, each with
+the side the other strand crosses from. Words are enumerated depth first
+with crossings labelled in order of first appearance, pruning any
+crossing interlaced with an odd number of others (Gauss's condition).
+The corners of each complete word are joined into faces; the word is a
+sphere curve exactly when there are n + 2 faces, and each choice of
+outside face is then a plane curve read from a starting edge.
+
+Rotating the starting edge gives the same curve, so by Burnside's lemma
+the number of curves is the sum over rooted curves of the number of
+rotations fixing them, divided by 2n. Memory use is that of one word.
+
+    python count_curves.py MAX_N [--output counts.csv] [--db ipc.db]
+"""
+import argparse
+import csv
+import sqlite3
+from collections import Counter
+
+from curve_code import Curve
+
+
+def _find(parent, x):
+    while parent[x] != x:
+        x = parent[x]
+    return x
+
+
+def _union(parent, a, b):
+    a, b = _find(parent, a), _find(parent, b)
+    if a != b:
+        parent[a] = b
+
+
+def word_faces(word):
+    """The face of each side of each edge, or None if not planar.
+
+    word[p] = (crossing, sign) for the passage p between edge p - 1 and
+    edge p. Sign +1 means the other strand crosses from right to left.
+    Returns a list with entry 2*i for the left of edge i and 2*i + 1
+    for its right.
+    """
+    length = len(word)
+    first = dict()
+    parent = list(range(2 * length))
+    for j, (crossing, _) in enumerate(word):
+        i = first.setdefault(crossing, j)
+        if i == j:
+            continue
+        left = lambda e: 2 * (e % length)
+        right = lambda e: 2 * (e % length) + 1
+        if word[i][1] > 0:
+            pairs = [(left(i), right(j)), (right(i), right(j - 1)),
+                     (right(i - 1), left(j - 1)), (left(i - 1), left(j))]
+        else:
+            pairs = [(left(i), left(j - 1)), (right(i), left(j)),
+                     (right(i - 1), right(j)), (left(i - 1), right(j - 1))]
+        for a, b in pairs:
+            _union(parent, a, b)
+
+    faces = [_find(parent, x) for x in range(2 * length)]
+    if len(set(faces)) != length // 2 + 2:
+        return None
+    return faces
+
+
+def _relabelled(word):
+    labels = dict()
+    return [(labels.setdefault(x, len(labels)), s) for x, s in word]
+
+
+def rotational_symmetries(word):
+    """The rotations k for which word[k:] + word[:k] is the same word."""
+    return [k for k in range(len(word))
+            if _relabelled(word[k:] + word[:k]) == word]
+
+
+def signed_gauss_words(n):
+    """Yield each rooted signed Gauss word with n crossings that passes
+    Gauss's parity condition, with the first crossing's sign +1."""
+    length = 2 * n
+    word = []
+    opened_at = []
+    open_crossings = set()
+
+    def extend():
+        p = len(word)
+        if p == length:
+            yield list(word)
+            return
+
+        # close an open crossing
+        for crossing in sorted(open_crossings):
+            o = opened_at[crossing]
+            interlaced = set()
+            for x, _ in word[o + 1:]:
+                interlaced ^= {x}
+            if len(interlaced) % 2:
+                continue
+            open_crossings.remove(crossing)
+            word.append((crossing, -word[o][1]))
+            yield from extend()
+            word.pop()
+            open_crossings.add(crossing)
+
+        # open a new crossing, leaving room to close the open ones
+        crossing = len(opened_at)
+        if crossing < n and len(open_crossings) + 1 <= length - p - 1:
+            opened_at.append(p)
+            open_crossings.add(crossing)
+            for s in ((+1,) if crossing == 0 else (+1, -1)):
+                word.append((crossing, s))
+                yield from extend()
+                word.pop()
+            open_crossings.remove(crossing)
+            opened_at.pop()
+
+    yield from extend()
+
+
+def _plane_curve(faces, out):
+    return Curve(
+        tuple(Curve.OUT if f == out else f for f in faces[i:i + 2])
+        for i in range(0, len(faces), 2)
+    )
+
+
+def plane_curves(n):
+    """Yield each curve with n vertices once."""
+    if n == 0:
+        yield Curve.canonical(1)
+        yield Curve.canonical(-1)
+        return
+
+    seen = set()
+    for word in signed_gauss_words(n):
+        faces = word_faces(word)
+        if faces is None:
+            continue
+        for out in set(faces):
+            curve = _plane_curve(faces, out)
+            for c in (curve, curve.mirror()):
+                key = c.canonical_key()
+                if key not in seen:
+                    seen.add(key)
+                    yield c
+
+
+def count_curves(n):
+    """Counter mapping whitney index to the number of curves with n vertices."""
+    if n == 0:
+        return Counter({1: 1, -1: 1})
+
+    length = 2 * n
+    totals = Counter()
+    for word in signed_gauss_words(n):
+        faces = word_faces(word)
+        if faces is None:
+            continue
+        rotations = rotational_symmetries(word)
+
+        for out in set(faces):
+            w = _plane_curve(faces, out).whitney()
+            i, side = divmod(faces.index(out), 2)
+            fixed = sum(1 for k in rotations
+                        if faces[2 * ((i + k) % length) + side] == out)
+            # The mirror image negates every sign and the Whitney index.
+            totals[w] += fixed
+            totals[-w] += fixed
+
+    for w, total in totals.items():
+        assert total % length == 0
+        totals[w] = total // length
+    return totals
+
+
+def db_counts(c):
+    c.execute("""
+        SELECT num_vertices, whitney, count(*) FROM curve
+        GROUP BY num_vertices, whitney
+    """)
+    result = dict()
+    for v, w, count in c.fetchall():
+        result.setdefault(v, Counter())[w] = count
+    return result
+
+
+def db_complete_through(c):
+    """The most vertices up to which a crawl has found every curve.
+
+    Moves change the vertex count by at most two, so while no curve with
+    fewer than m vertices is unexplored, every curve with at most m - 3
+    has been found. None if nothing is left unexplored.
+    """
+    c.execute("SELECT min(num_vertices) FROM curve WHERE explored = 0")
+    (m,) = c.fetchone()
+    return None if m is None else m - 3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('max_n', type=int)
+    parser.add_argument('--output', default='counts.csv')
+    parser.add_argument('--db', help='compare against a crawl database')
+    args = parser.parse_args(argv)
+
+    counted = dict()
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['num_vertices', 'whitney', 'count'])
+        for n in range(args.max_n + 1):
+            counted[n] = count_curves(n)
+            for w, count in sorted(counted[n].items()):
+                writer.writerow([n, w, count])
+            f.flush()
+            print(n, sum(counted[n].values()), dict(sorted(counted[n].items())))
+
+    if args.db:
+        c = sqlite3.connect(args.db).cursor()
+        crawled = db_counts(c)
+        complete = db_complete_through(c)
+        for n in sorted(set(counted) & set(crawled)):
+            if counted[n] == crawled[n]:
+                continue
+            if complete is not None and n > complete:
+                print(f"{n} vertices, partly crawled: counted "
+                      f"{sum(counted[n].values())}, "
+                      f"crawled {sum(crawled[n].values())} so far")
+            else:
+                print(f"{n} vertices differ: counted {dict(counted[n])}, "
+                      f"crawled {dict(crawled[n])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import json
+import time
+from collections import Counter
+
+
+class CrawlMetrics:
+    """Counters and phase timers for a crawl, written out as JSON lines.
+
+    Nothing is written until a path is set. Each line is a snapshot of
+    the running totals, plus curves explored per second by vertex count
+    since the previous line.
+    """
+
+    def __init__(self, path=None, interval=60.0):
+        self.path = path
+        self.interval = interval
+        self.start = time.time()
+        self.last_emit = self.start
+
+        # by move name
+        self.generated = Counter()
+        self.hits = Counter()
+        self.misses = Counter()
+        # phase -> seconds
+        self.timers = Counter()
+        # num_vertices -> curves explored
+        self.explored = Counter()
+        self.explored_at_last_emit = Counter()
+
+    def add_time(self, phase, seconds):
+        self.timers[phase] += seconds
+
+    def lookup(self, move, hit):
+        if hit:
+            self.hits[move.name] += 1
+        else:
+            self.misses[move.name] += 1
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = now - self.last_emit
+        rates = {
+            v: (n - self.explored_at_last_emit[v]) / elapsed
+            for v, n in sorted(self.explored.items())
+        } if elapsed > 0 else {}
+        moves = {
+            name: {
+                'generated': self.generated[name],
+                'hit': self.hits[name],
+                'miss': self.misses[name],
+            }
+            for name in sorted(self.generated)
+        }
+        return {
+            'time': now,
+            'elapsed': now - self.start,
+            'moves': moves,
+            'timers': dict(self.timers),
+            'explored': dict(sorted(self.explored.items())),
+            'curves_per_sec': rates,
+        }
+
+    def emit(self, force=False):
+        """Append a snapshot if the interval has passed."""
+        if self.path is None:
+            return
+        if not force and time.time() - self.last_emit < self.interval:
+            return
+        line = json.dumps(self.snapshot())
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+        self.last_emit = time.time()
+        self.explored_at_last_emit = self.explored.copy()
@@ -1,12 +1,23 @@
+import argparse
+import heapq
+import importlib
+import queue
+import signal
 import sqlite3
+import sys
+import threading
 import time
 import os
+from itertools import groupby
 
-from curve_code import Curve, Move
+from curve_code import Curve, SphericalCurve, Move, SYMMETRIES, symmetry_coset
+from crawl_metrics import CrawlMetrics
+from neighbor_pool import NeighborPool
+from profiling import profiled
 
 schema_sql = '''\
 PRAGMA writable_schema = 1;
-delete from sqlite_master where type in ('table', 'index', 'trigger');
+delete from sqlite_master where type in ('table', 'index', 'trigger', 'view');
 PRAGMA writable_schema = 0;
 VACUUM;
 PRAGMA INTEGRITY_CHECK;
@@ -15,9 +26,10 @@ CREATE TABLE curve (
     id INTEGER PRIMARY KEY NOT NULL,
     hash INTEGER NOT NULL,
     num_vertices INTEGER NOT NULL,
-    whitney INTEGER NOT NULL,
+    whitney INTEGER, -- NULL for spherical curves
     explored INTEGER NOT NULL,
-    distance INTEGER NOT NULL
+    distance INTEGER NOT NULL,
+    symmetries INTEGER -- stabilizer bitmask, NULL unless symmetry reduced
 );
 CREATE INDEX idx_hash ON curve (hash);
 CREATE INDEX idx_num_vertices ON curve(num_vertices);
@@ -42,13 +54,34 @@ CREATE TABLE move (
     start_curve_id INTEGER NOT NULL,
     end_curve_id INTEGER NOT NULL,
     type_id INTEGER NOT NULL,
-    multiplicity INTEGER,
+    -- type_id is odd unless symmetry reduced; see record_move()
+    multiplicity INTEGER NOT NULL DEFAULT 0,
+    inverse_multiplicity INTEGER NOT NULL DEFAULT 0,
+    -- symmetry taking the actual neighbor to end_curve_id's representative
+    symmetry INTEGER NOT NULL DEFAULT 0,
     
-    PRIMARY KEY (start_curve_id, end_curve_id, type_id),
+    PRIMARY KEY (start_curve_id, end_curve_id, type_id, symmetry),
     FOREIGN KEY (start_curve_id) REFERENCES curve (id),
     FOREIGN KEY (end_curve_id) REFERENCES curve (id),
     FOREIGN KEY (type_id) REFERENCES move_type (id)
 );
+
+-- Both directions of every move.
+CREATE VIEW all_moves AS
+SELECT start_curve_id, end_curve_id, type_id, multiplicity, symmetry
+FROM move WHERE multiplicity > 0
+UNION ALL
+SELECT end_curve_id, start_curve_id, type_id + 1, inverse_multiplicity, symmetry
+FROM move WHERE inverse_multiplicity > 0;
+
+-- Curves per (num_vertices, distance), kept up to date by insert_curve.
+CREATE TABLE stats (
+    num_vertices INTEGER NOT NULL,
+    distance INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+
+    PRIMARY KEY (num_vertices, distance)
+);
 '''
 
 def initialize(c):
@@ -56,36 +89,59 @@ def initialize(c):
     c.executemany("""
             INSERT into move_type VALUES (?, ?);
         """, ((move.value, move.name) for move in Move))
+    counts.clear()
+
+
+def load_counts(c):
+    """Resume the in-memory counts from the stats table."""
+    counts.clear()
+    c.execute("SELECT num_vertices, distance, count FROM stats")
+    for v, d, n in c.fetchall():
+        counts.setdefault(v, dict())[d] = n
+
+# Curve for a plane crawl, SphericalCurve for a sphere crawl.
+curve_class = Curve
+# Store one representative per orbit under reversal and mirror.
+symmetry_reduced = False
 
 start = time.time()
 dbsize = 0
 hits = 0
 misses = 0
+# counts[num_vertices][distance], mirroring the stats table
+counts = dict()
+metrics = CrawlMetrics()
+# Frontier told about each inserted curve, if any.
+frontier = None
+# main() exits with this when a Budget stops the crawl.
+EXIT_BUDGET = 3
 
 def print_progress(c):
     print(f"{time.time() - start:.2f}  Size: {dbsize / 10 ** 6:.2f}M.  "
-          f"Hits: {hits}.  Misses: {misses}.  {hits / (hits+misses):.2%}")
-    c.execute("""
-        SELECT num_vertices, distance, count(*) 
-        FROM curve GROUP BY num_vertices, distance
-    """)
-    counts = dict()
-    for v, d, n in c.fetchall():
-        counts.setdefault(v, dict())[d] = n
+          f"Hits: {hits}.  Misses: {misses}.  {hits / max(hits + misses, 1):.2%}")
 
     print("depth: ", max(d for ds in counts.values() for d in ds))
 
-    for v, distances in counts.items():
+    for v in sorted(counts):
+        distances = dict(sorted(counts[v].items()))
         print(v, sum(distances.values()), distances)
 
     print()
 
 
-def insert_curve(c, curve: Curve, distance):
+@profiled
+def insert_curve(c, curve: Curve, distance, symmetries=None):
+    """Store a new curve; symmetries is its stabilizer, in a symmetry
+    reduced crawl, if already known."""
+    if symmetry_reduced and symmetries is None:
+        symmetries = curve.symmetry_reduced()[2]
+    v = curve.num_vertices()
+    w = curve.whitney()
     c.execute("""
-        INSERT INTO curve (hash, num_vertices, whitney, explored, distance)
-            VALUES (?, ?, ?, ?, ?);
-    """, (hash(curve), curve.num_vertices(), curve.whitney(), 0, distance))
+        INSERT INTO curve (hash, num_vertices, whitney, explored, distance,
+                           symmetries)
+            VALUES (?, ?, ?, ?, ?, ?);
+    """, (hash(curve), v, w, 0, distance, symmetries))
     cid = c.lastrowid
 
     c.executemany("""
@@ -93,6 +149,16 @@ def insert_curve(c, curve: Curve, distance):
         VALUES (?, ?, ?, ?);
     """, ((cid, i, a, b) for i, (a, b) in enumerate(curve)))
 
+    c.execute("""
+        INSERT INTO stats (num_vertices, distance, count) VALUES (?, ?, 1)
+        ON CONFLICT (num_vertices, distance) DO UPDATE SET count = count + 1
+    """, (v, distance))
+    distances = counts.setdefault(v, dict())
+    distances[distance] = distances.get(distance, 0) + 1
+
+    if frontier is not None:
+        frontier.push(cid, distance, v, w)
+
     global dbsize
     dbsize += 1
     if dbsize % 50_000 == 0:
@@ -101,134 +167,780 @@ def insert_curve(c, curve: Curve, distance):
     return cid
 
 
-def unexplored_ids_bfs(c):
-    highest_min_left = 0
-    while True:
+def lower_distance(c, cid, distance):
+    """Lower a curve's distance if the given one is smaller."""
+    c.execute("SELECT num_vertices, distance FROM curve WHERE id = ?", (cid,))
+    v, old = c.fetchone()
+    if distance >= old:
+        return
+    c.execute("UPDATE curve SET distance = ? WHERE id = ?", (distance, cid))
+    c.execute("""
+        UPDATE stats SET count = count - 1 WHERE num_vertices = ? AND distance = ?
+    """, (v, old))
+    c.execute("""
+        DELETE FROM stats WHERE num_vertices = ? AND distance = ? AND count = 0
+    """, (v, old))
+    c.execute("""
+        INSERT INTO stats (num_vertices, distance, count) VALUES (?, ?, 1)
+        ON CONFLICT (num_vertices, distance) DO UPDATE SET count = count + 1
+    """, (v, distance))
+    distances = counts.setdefault(v, dict())
+    distances[old] -= 1
+    if not distances[old]:
+        del distances[old]
+    distances[distance] = distances.get(distance, 0) + 1
+
+
+def bfs_key(distance, num_vertices, whitney):
+    return distance, num_vertices
+
+
+def vertex_first_key(distance, num_vertices, whitney):
+    return num_vertices, distance
+
+
+def whitney_key(distance, num_vertices, whitney):
+    return abs(whitney or 0), num_vertices, distance
+
+
+STRATEGIES = {
+    'bfs': bfs_key,
+    'vertex-first': vertex_first_key,
+    'whitney': whitney_key,
+}
+
+
+class Frontier:
+    """The unexplored curves, in a heap ordered by a strategy.
+
+    A strategy maps (distance, num_vertices, whitney) to a sort key,
+    computed once per curve; ties go to the curve inserted first. Curves
+    beyond the bounds are never scheduled and stay unexplored.
+    """
+
+    def __init__(self, strategy=bfs_key, max_vertices=None, max_distance=None):
+        self.strategy = strategy
+        self.max_vertices = max_vertices
+        self.max_distance = max_distance
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _entry(self, cid, distance, num_vertices, whitney):
+        if self.max_vertices is not None and num_vertices > self.max_vertices:
+            return None
+        if self.max_distance is not None and distance > self.max_distance:
+            return None
+        return self.strategy(distance, num_vertices, whitney), cid, distance
+
+    def push(self, cid, distance, num_vertices, whitney):
+        entry = self._entry(cid, distance, num_vertices, whitney)
+        if entry is not None:
+            heapq.heappush(self._heap, entry)
+
+    def peek(self):
+        """(id, distance) of the next curve, without removing it."""
+        _, cid, distance = self._heap[0]
+        return cid, distance
+
+    def pop(self):
+        return heapq.heappop(self._heap)[1]
+
+    def seed(self, c):
+        """Add every unexplored curve in the database."""
         c.execute("""
-            SELECT id FROM curve 
+            SELECT id, distance, num_vertices, whitney FROM curve
             WHERE explored = 0
-            ORDER BY distance ASC, num_vertices ASC
-            LIMIT 1
         """)
-        (cid,) = c.fetchone()
-        yield cid
-
-        global dbsize
-        if dbsize % 1000 != 0:
-            continue
-
-        c.execute("SELECT min(num_vertices) FROM curve WHERE explored=0")
-        (min_left,) = c.fetchone()
-
-        if min_left > highest_min_left:
-            n = min_left - 1
-            print('-' * 80)
-            print(f"No v<={n} found; Any new {n}s must go through {n+1}.")
-            print(f"Found all {n-2}, almost all {n-1}, most {n}.")
-            print_progress(c)
-            highest_min_left = min_left
-
-def unexplored_ids_vert_first(c):
-    highest_min_left = 1
-    while True:
-        c.execute("""
-            SELECT id FROM curve
-            WHERE explored = 0
-            AND num_vertices <= ?
-            ORDER BY num_vertices ASC
-            LIMIT 1
-        """, (highest_min_left,))
-
-        cid = c.fetchone()
-        if cid is None:
-            n = highest_min_left
-            print('-' * 80)
-            print(f"No v<={n} found; Any new {n}s must go through {n+1}.")
-            print(f"Found all {n-2}, almost all {n-1}, most {n}.")
-            print_progress(c)
-            highest_min_left += 1
-        else:
-            yield cid[0]
-
-
-def fetch_curve(c, cid) -> Curve:
+        self._heap.extend(entry for entry in (self._entry(*row) for row in c)
+                          if entry is not None)
+        heapq.heapify(self._heap)
+
+    def __iter__(self):
+        while self._heap:
+            yield self.pop()
+
+
+def _rss_bytes():
+    """Resident set size now, or at its peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Budget:
+    """Limits that stop a crawl early, leaving it resumable.
+
+    Any limit may be None. Curves counts every curve in the database,
+    and the database size includes its rollback journal or write-ahead
+    log. exceeded() reads the clock each call and measures the rest
+    every check_every calls; stop() makes it report a reason at once,
+    for a signal handler.
+    """
+
+    def __init__(self, seconds=None, rss_bytes=None, db_bytes=None,
+                 curves=None, path=None, check_every=100):
+        self.seconds = seconds
+        self.rss_bytes = rss_bytes
+        self.db_bytes = db_bytes
+        self.curves = curves
+        self.path = path
+        self.check_every = check_every
+        self.start = time.time()
+        self.reason = None
+        self._calls = 0
+
+    def stop(self, reason):
+        self.reason = self.reason or reason
+
+    def db_size(self):
+        return sum(os.path.getsize(p)
+                   for p in (self.path, self.path + '-journal',
+                             self.path + '-wal')
+                   if p is not None and os.path.exists(p))
+
+    def exceeded(self):
+        """The first limit reached, as a string, or None."""
+        self._calls += 1
+        if self.reason is not None:
+            pass
+        elif self.seconds is not None \
+                and time.time() - self.start >= self.seconds:
+            self.stop(f"wall time {self.seconds}s")
+        elif self._calls % self.check_every == 0:
+            if self.rss_bytes is not None and _rss_bytes() >= self.rss_bytes:
+                self.stop(f"RSS {self.rss_bytes / 2 ** 20:.0f}MiB")
+            elif self.db_bytes is not None and self.db_size() >= self.db_bytes:
+                self.stop(f"database size {self.db_bytes / 2 ** 20:.0f}MiB")
+            elif self.curves is not None and sum(
+                    n for ds in counts.values() for n in ds.values()) >= self.curves:
+                self.stop(f"{self.curves} curves")
+        return self.reason
+
+
+@profiled
+def fetch_curve(c, cid, cls=Curve) -> Curve:
     c.execute("""
         SELECT left_face, right_face FROM curve_edge
         WHERE curve_id = ? ORDER BY position
     """, (cid,))
-    return Curve(c.fetchall())
-
-def get_cid(c, curve, distance_if_inserting):
+    return cls(c.fetchall())
+
+def iter_curves(c, condition='1', params=(), cls=Curve):
+    """Yield (id, num_vertices, whitney, distance, curve) for each curve
+    matching the SQL condition, in id order.
+
+    Rows are streamed from one join, so the cursor is busy until the
+    generator finishes.
+    """
+    c.execute(f"""
+        SELECT curve.id, num_vertices, whitney, distance, left_face, right_face
+        FROM curve JOIN curve_edge ON curve_edge.curve_id = curve.id
+        WHERE {condition}
+        ORDER BY curve.id, position
+    """, params)
+    for (cid, v, w, d), rows in groupby(c, key=lambda row: row[:4]):
+        yield cid, v, w, d, cls(row[4:] for row in rows)
+
+
+def find_cid(c, curve):
+    """The id of a stored curve equal to this one, or None."""
+    t0 = time.perf_counter()
     h = hash(curve)
+    t1 = time.perf_counter()
     c.execute("""
         SELECT id FROM curve WHERE hash = ?
     """, (h,))
-
-    for (cid,) in c.fetchall():
-        curve_candidate = fetch_curve(c, cid)
-        if curve_candidate == curve:
-            global hits
-            hits += 1
+    rows = c.fetchall()
+    metrics.add_time('hash', t1 - t0)
+    metrics.add_time('db', time.perf_counter() - t1)
+
+    for (cid,) in rows:
+        t0 = time.perf_counter()
+        curve_candidate = fetch_curve(c, cid, type(curve))
+        t1 = time.perf_counter()
+        equal = curve_candidate == curve
+        metrics.add_time('db', t1 - t0)
+        metrics.add_time('compare', time.perf_counter() - t1)
+        if equal:
             return cid
+    return None
+
+
+@profiled
+def get_cid(c, curve, distance_if_inserting, move=None, symmetries=None):
+    cid = find_cid(c, curve)
+    if cid is not None:
+        global hits
+        hits += 1
+        if move is not None:
+            metrics.lookup(move, hit=True)
+        return cid
 
     global misses
     misses += 1
-    return insert_curve(c, curve, distance_if_inserting)
+    if move is not None:
+        metrics.lookup(move, hit=False)
+    t0 = time.perf_counter()
+    cid = insert_curve(c, curve, distance_if_inserting, symmetries)
+    metrics.add_time('insert', time.perf_counter() - t0)
+    return cid
 
 
-def add_edge(c, curve1, curve1_id, move, curve2, c2_distance):
-    cid2 = get_cid(c, curve2, c2_distance)
+def record_move(c, start_id, end_id, move, multiplicity=1, symmetry=None):
+    """Count a move in the row for its adding direction.
+
+    Each pair of inverse moves shares one row, keyed by the odd (adding)
+    move type: multiplicity counts that move from start_curve_id and
+    inverse_multiplicity counts the inverse from end_curve_id. The
+    all_moves view lists both directions.
+
+    Moves of a symmetry reduced crawl carry a symmetry and are stored as
+    found, since the inverse of a move between representatives need not
+    be a move between the same representatives.
+    """
+    column = 'multiplicity'
+    if symmetry is None:
+        symmetry = 0
+        if move.value % 2 == 0:
+            start_id, end_id = end_id, start_id
+            move = move.inverse()
+            column = 'inverse_multiplicity'
+
+    c.execute(f"""
+        INSERT INTO move (start_curve_id, end_curve_id, type_id, symmetry,
+                          {column})
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (start_curve_id, end_curve_id, type_id, symmetry)
+        DO UPDATE SET {column} = {column} + excluded.{column}
+    """, (start_id, end_id, move.value, symmetry, multiplicity))
+
+
+@profiled
+def add_edge(c, curve1, curve1_id, move, curve2, c2_distance, symmetry=None,
+             symmetries=None):
+    cid2 = get_cid(c, curve2, c2_distance, move, symmetries)
+    t0 = time.perf_counter()
+    record_move(c, curve1_id, cid2, move, 1, symmetry)
+    metrics.add_time('db', time.perf_counter() - t0)
+
+    # c.execute("""
+    #     UPDATE curve SET distance = min(distance, ?) WHERE id = ?
+    # """, (c2_distance, cid2))
+    # c.execute("""
+    #     SELECT distance from curve WHERE id = ?
+    # """, (cid2,))
+    # assert c.fetchone()[0] <= c2_distance
+
+
+def _neighbors(curve):
+    return list(curve.neighbors())
+
+
+def prepare_neighbors(neighbors):
+    """(move, curve, symmetry, symmetries) for each (move, curve), with
+    the curve symmetry reduced and its stabilizer found if the crawl is,
+    and its hash computed."""
+    for move, c2 in neighbors:
+        symmetry = symmetries = None
+        if symmetry_reduced:
+            t0 = time.perf_counter()
+            c2, symmetry, symmetries = c2.symmetry_reduced()
+            metrics.add_time('symmetry', time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        hash(c2)
+        metrics.add_time('hash', time.perf_counter() - t0)
+        yield move, c2, symmetry, symmetries
+
+
+def record_explored(c, cid, curve, d, prepared):
+    """Add the edges to a curve's prepared neighbors and mark it explored."""
+    for move, c2, symmetry, symmetries in prepared:
+        metrics.generated[move.name] += 1
+        add_edge(c, curve, cid, move, c2, d+1, symmetry, symmetries)
     c.execute("""
-        SELECT multiplicity FROM move 
-        WHERE start_curve_id = ? AND end_curve_id = ? and type_id = ?
-    """, (curve1_id, cid2, move.value))
-
-    move_rows = c.fetchall()
-    if move_rows:
-        ((mult,),) = move_rows
-        c.execute("""
-            UPDATE move SET multiplicity = ? 
-            WHERE start_curve_id = ? AND end_curve_id = ? and type_id = ?
-        """, (mult+1, curve1_id, cid2, move.value))
-    else:
-        c.execute("""
-            INSERT INTO move (start_curve_id, end_curve_id, type_id, multiplicity)
-            VALUES (?, ?, ?, ?)
-        """, (curve1_id, cid2, move.value, 1))
+        UPDATE curve SET explored = 1 WHERE id = ?
+    """, (cid,))
 
-        # c.execute("""
-        #     UPDATE curve SET distance = min(distance, ?) WHERE id = ?
-        # """, (c2_distance, cid2))
-        # c.execute("""
-        #     SELECT distance from curve WHERE id = ?
-        # """, (cid2,))
-        # assert c.fetchone()[0] <= c2_distance
+    metrics.explored[curve.num_vertices()] += 1
+    metrics.emit()
 
 
-def process_cid(c, cid):
-    curve = fetch_curve(c, cid)
+@profiled
+def process_cid(c, cid, neighbors=None):
+    """Explore a curve; neighbors may be given if already generated."""
+    curve = fetch_curve(c, cid, curve_class)
 
     c.execute("""
         SELECT distance FROM curve WHERE id = ?
     """, (cid,))
     (d,) = c.fetchone()
 
-    for move, c2 in curve.neighbors():
-        add_edge(c, curve, cid, move, c2, d+1)
+    if neighbors is None:
+        t0 = time.perf_counter()
+        neighbors = _neighbors(curve)
+        metrics.add_time('neighbors', time.perf_counter() - t0)
+
+    record_explored(c, cid, curve, d, prepare_neighbors(neighbors))
+
+
+def _set_frontier(new_frontier):
+    global frontier
+    old, frontier = frontier, new_frontier
+    return old
+
+
+def crawl(c, frontier, workers=1, batch_size=64, budget=None,
+          commit_every=1000):
+    """Explore curves in frontier order until it is empty, or until the
+    budget is exceeded; return the budget's reason in that case.
+
+    The frontier is told about the curves inserted meanwhile. With
+    several workers, neighbors of the next batch_size curves are
+    generated in a NeighborPool while this process writes them in order.
+    The connection is committed every commit_every curves explored, so
+    a killed crawl loses at most that many. Curves popped but not
+    explored when the budget runs out are still unexplored in the
+    database, where Frontier.seed() finds them.
+    """
+    hook = _set_frontier(frontier)
+    try:
+        return _crawl(c, frontier, workers, batch_size, budget, commit_every)
+    finally:
+        _set_frontier(hook)
+
+
+def _crawl(c, frontier, workers, batch_size, budget, commit_every):
+    explored = 0
+
+    def stop():
+        nonlocal explored
+        explored += 1
+        if explored % commit_every == 0:
+            c.connection.commit()
+        return budget is not None and budget.exceeded()
+
+    if workers <= 1:
+        for cid in frontier:
+            process_cid(c, cid)
+            if stop():
+                return budget.reason
+        return None
+
+    with NeighborPool(workers, curve_class) as pool:
+        while frontier:
+            cids = [frontier.pop()
+                    for _ in range(min(batch_size, len(frontier)))]
+            curves = [(cid, fetch_curve(c, cid, curve_class)) for cid in cids]
+            for cid, neighbors in pool.imap(curves):
+                process_cid(c, cid, [(move, curve_class.unpack(code))
+                                     for move, code in neighbors])
+                if stop():
+                    return budget.reason
+    return None
+
+
+class _Deferred:
+    """Stands in for the frontier while inserted curves are uncommitted."""
+
+    def __init__(self):
+        self.entries = []
+
+    def push(self, *entry):
+        self.entries.append(entry)
+
+
+def pipelined_crawl(path, frontier, queue_size=64, commit_every=1000,
+                    budget=None):
+    """Explore curves in frontier order, in four threaded stages.
+
+    fetch        pops the frontier and reads codes on its own connection
+    neighbors    generates the moves from each curve
+    keys         symmetry reduces and hashes the neighbors
+    write        looks up, inserts and records moves on its own connection
+
+    Stages pass work through queues of queue_size, so a slow stage holds
+    back the ones before it. The writer commits every commit_every curves
+    and whenever it runs dry, and only then adds the curves it inserted
+    to the frontier, so the fetch stage never reads uncommitted rows. A
+    curve is fetched only if no curve in flight has a smaller distance,
+    so distances are what a one-at-a-time crawl would give.
+
+    Once the budget is exceeded, fetching stops and the curves in flight
+    are dropped, to stay unexplored; the budget's reason is returned.
+    """
+    lock = threading.Condition()
+    # distance -> curves popped but not yet committed
+    in_flight = dict()
+    deferred = _Deferred()
+    failures = []
+    neighbors_q = queue.Queue(queue_size)
+    keys_q = queue.Queue(queue_size)
+    write_q = queue.Queue(queue_size)
+
+    def fetch():
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        try:
+            while True:
+                with lock:
+                    while True:
+                        if failures or stopping():
+                            return
+                        if frontier and (not in_flight
+                                         or frontier.peek()[1] <= min(in_flight)):
+                            break
+                        if not frontier and not in_flight:
+                            return
+                        lock.wait()
+                    cid, d = frontier.peek()
+                    frontier.pop()
+                    in_flight[d] = in_flight.get(d, 0) + 1
+                neighbors_q.put((cid, d, fetch_curve(c, cid, curve_class)))
+        finally:
+            neighbors_q.put(None)
+            conn.close()
+
+    def stopping():
+        return budget is not None and budget.reason is not None
+
+    def generate():
+        try:
+            while (item := neighbors_q.get()) is not None:
+                if stopping():
+                    continue
+                cid, d, curve = item
+                t0 = time.perf_counter()
+                neighbors = _neighbors(curve)
+                metrics.add_time('neighbors', time.perf_counter() - t0)
+                keys_q.put((cid, d, curve, neighbors))
+        finally:
+            keys_q.put(None)
+
+    def keys():
+        try:
+            while (item := keys_q.get()) is not None:
+                if stopping():
+                    continue
+                cid, d, curve, neighbors = item
+                write_q.put((cid, d, curve, list(prepare_neighbors(neighbors))))
+        finally:
+            write_q.put(None)
+
+    def write():
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        written = []
+
+        def publish():
+            conn.commit()
+            with lock:
+                for entry in deferred.entries:
+                    frontier.push(*entry)
+                deferred.entries.clear()
+                for d in written:
+                    in_flight[d] -= 1
+                    if not in_flight[d]:
+                        del in_flight[d]
+                written.clear()
+                lock.notify_all()
+
+        try:
+            while True:
+                try:
+                    item = write_q.get(timeout=0.01) if written else write_q.get()
+                except queue.Empty:
+                    publish()
+                    continue
+                if item is None:
+                    break
+                if stopping():
+                    continue
+                cid, d, curve, prepared = item
+                record_explored(c, cid, curve, d, prepared)
+                written.append(d)
+                if budget is not None and budget.exceeded():
+                    with lock:
+                        lock.notify_all()
+                if len(written) >= commit_every:
+                    publish()
+            publish()
+        finally:
+            conn.close()
+
+    def stage(target):
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                with lock:
+                    failures.append(e)
+                    lock.notify_all()
+        return threading.Thread(target=run, name=target.__name__, daemon=True)
+
+    # Readers see the last commit while the writer carries on.
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+    threads = [stage(f) for f in (fetch, generate, keys, write)]
+    hook = _set_frontier(deferred)
+    try:
+        for t in threads:
+            t.start()
+        threads[-1].join()
+    finally:
+        _set_frontier(hook)
+    if failures:
+        raise failures[0]
+    return None if budget is None else budget.reason
+
+
+def rebuild_stats(c):
+    """Recount the stats table, and the counts, from the curve table."""
+    c.execute("DELETE FROM stats")
     c.execute("""
-        UPDATE curve SET explored = 1 WHERE id = ?
-    """, (cid,))
-
-
-
-if __name__ == '__main__':
-    conn = sqlite3.connect('ipc.db')
+        INSERT INTO stats (num_vertices, distance, count)
+        SELECT num_vertices, distance, count(*) FROM curve
+        GROUP BY num_vertices, distance
+    """)
+    load_counts(c)
+
+
+def recompute_distances(c, start_id):
+    """Set each distance to the fewest moves from start_id in the move
+    table, breadth first. Curves it does not reach keep theirs."""
+    c.execute("SELECT DISTINCT start_curve_id, end_curve_id FROM all_moves")
+    edges = dict()
+    for cid, end_id in c.fetchall():
+        edges.setdefault(cid, []).append(end_id)
+    distances = {start_id: 0}
+    level = [start_id]
+    while level:
+        next_level = []
+        for cid in level:
+            for end_id in edges.get(cid, ()):
+                if end_id not in distances:
+                    distances[end_id] = distances[cid] + 1
+                    next_level.append(end_id)
+        level = next_level
+    c.executemany("UPDATE curve SET distance = ? WHERE id = ?",
+                  ((d, cid) for cid, d in distances.items()))
+    rebuild_stats(c)
+
+
+def trim_to_distance(c, max_distance):
+    """Keep what a crawl with this max_distance stores: curves within it
+    explored, with their moves, and the curves one further unexplored."""
+    c.execute("""
+        UPDATE curve SET explored = 0 WHERE distance > ?
+    """, (max_distance,))
+    c.execute("""
+        UPDATE move SET multiplicity = 0 WHERE start_curve_id IN
+            (SELECT id FROM curve WHERE explored = 0)
+    """)
+    c.execute("""
+        UPDATE move SET inverse_multiplicity = 0 WHERE end_curve_id IN
+            (SELECT id FROM curve WHERE explored = 0)
+    """)
+    c.execute("""
+        DELETE FROM move WHERE multiplicity = 0 AND inverse_multiplicity = 0
+    """)
+    c.execute("""
+        DELETE FROM curve_edge WHERE curve_id IN
+            (SELECT id FROM curve WHERE distance > ?)
+    """, (max_distance + 1,))
+    c.execute("DELETE FROM curve WHERE distance > ?", (max_distance + 1,))
+    rebuild_stats(c)
+
+
+def expand_spherical(sphere_c, plane_c):
+    """Fill a new plane database from the explored curves of a sphere
+    crawl.
+
+    Each plane curve gets the distance of its spherical curve. No moves
+    are recorded.
+    """
+    initialize(plane_c)
+    sphere_c.execute("""
+        SELECT id, distance FROM curve WHERE explored = 1 ORDER BY id
+    """)
+    for cid, d in sphere_c.fetchall():
+        sphere = fetch_curve(sphere_c, cid, SphericalCurve)
+        for curve in sphere.plane_curves():
+            get_cid(plane_c, curve, d)
+
+
+def expand_symmetry_reduced(reduced_c, full_c, max_distance=None):
+    """Rebuild the full curve and move tables from a symmetry reduced
+    crawl, in a new database.
+
+    Every image of a representative gets its own row, and each stored
+    move x -> g(y) becomes h(x) -> h(y) for each distinct image h(x).
+
+    The reduced crawl measures distance from the start curve's orbit,
+    which holds canonical(-1) as well as canonical(1), so distances are
+    then counted again from canonical(1) alone. A reduced crawl with
+    max_distance explores every curve within it, and some beyond; given
+    the same max_distance, the extra curves and moves are dropped, leaving
+    what a plain crawl with it stores.
+    """
+    initialize(full_c)
+    reduced_c.execute("""
+        SELECT id, distance, explored, symmetries FROM curve ORDER BY id
+    """)
+    ids = dict()
+    stabilizers = dict()
+    for cid, d, explored, stabilizer in reduced_c.fetchall():
+        rep = fetch_curve(reduced_c, cid)
+        stabilizers[cid] = stabilizer
+        for h in SYMMETRIES:
+            if h == symmetry_coset(h, stabilizer):
+                new_id = insert_curve(full_c, rep.transformed(h), d)
+                full_c.execute("""
+                    UPDATE curve SET explored = ?, symmetries = NULL
+                    WHERE id = ?
+                """, (explored, new_id))
+                ids[cid, h] = new_id
+
+    reduced_c.execute("""
+        SELECT start_curve_id, end_curve_id, type_id, multiplicity, symmetry
+        FROM all_moves
+    """)
+    for start_id, end_id, type_id, mult, g in reduced_c.fetchall():
+        for h in SYMMETRIES:
+            if h != symmetry_coset(h, stabilizers[start_id]):
+                continue
+            # y = g(end), so h(y) = (h ^ g)(end)
+            end_h = symmetry_coset(h ^ g, stabilizers[end_id])
+            record_move(full_c, ids[start_id, h], ids[end_id, end_h],
+                        Move(type_id).transformed(h), mult)
+
+    recompute_distances(full_c, find_cid(full_c, Curve(Curve.canonical(1))))
+    if max_distance is not None:
+        trim_to_distance(full_c, max_distance)
+
+
+def expand(source_c, full_c, max_distance=None):
+    """Fill a new plane database from a spherical or symmetry reduced
+    crawl, telling which from its rows."""
+    source_c.execute("SELECT whitney, symmetries FROM curve ORDER BY id LIMIT 1")
+    w, symmetries = source_c.fetchone()
+    if w is None:
+        expand_spherical(source_c, full_c)
+    elif symmetries is not None:
+        expand_symmetry_reduced(source_c, full_c, max_distance)
+    else:
+        raise ValueError("already a full plane crawl")
+
+
+def print_budget_summary(c, budget):
+    c.execute("SELECT count(*) FROM curve WHERE explored = 0")
+    (unexplored,) = c.fetchone()
+    print(f"Stopped at {budget.reason} after {time.time() - budget.start:.0f}s: "
+          f"explored {sum(metrics.explored.values())} and found {dbsize} curves, "
+          f"database {budget.db_size() / 2 ** 20:.1f}MiB, "
+          f"RSS {_rss_bytes() / 2 ** 20:.0f}MiB.")
+    print(f"Everything is committed, and the frontier is the {unexplored} "
+          f"unexplored curves. Continue with --resume.")
+
+
+def load_strategy(name):
+    """A strategy from STRATEGIES, or any key function as 'module:name'."""
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+def main(argv=None):
+    global curve_class, symmetry_reduced, frontier
+
+    parser = argparse.ArgumentParser(description='Crawl plane curves by moves.')
+    parser.add_argument('--db', help='defaults to ipc.db, ipc_sphere.db or '
+                                     'ipc_reduced.db by mode')
+    mode = parser.add_mutually_exclusive_group()
+    # One row per sphere curve; --expand recovers the plane.
+    mode.add_argument('--spherical', action='store_true')
+    # --expand rebuilds the full tables.
+    mode.add_argument('--symmetry-reduced', action='store_true')
+    mode.add_argument('--expand', metavar='SOURCE',
+                      help='instead of crawling, fill --db with the plane '
+                           'curves of the spherical or symmetry reduced crawl '
+                           'in SOURCE; --max-distance should be the one '
+                           'SOURCE was crawled with')
+    parser.add_argument('--strategy', default='bfs',
+                        help=f"one of {', '.join(STRATEGIES)} or module:function")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap generation and writes in threads')
+    parser.add_argument('--max-vertices', type=int)
+    parser.add_argument('--max-distance', type=int)
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the crawl in an existing database')
+    budget_args = parser.add_argument_group(
+        'budgets', f'stop cleanly, with exit status {EXIT_BUDGET}, once one '
+                   'is reached; SIGTERM stops the same way')
+    budget_args.add_argument('--max-seconds', type=float)
+    budget_args.add_argument('--max-rss', type=float, metavar='MIB')
+    budget_args.add_argument('--max-db-size', type=float, metavar='MIB')
+    budget_args.add_argument('--max-curves', type=int)
+    args = parser.parse_args(argv)
+
+    if args.spherical:
+        curve_class = SphericalCurve
+        name = 'ipc_sphere'
+    elif args.symmetry_reduced:
+        symmetry_reduced = True
+        name = 'ipc_reduced'
+    else:
+        name = 'ipc'
+    path = args.db or f'{name}.db'
+    conn = sqlite3.connect(path)
     c = conn.cursor()
+    # beside the database, so crawls in other databases keep their own
+    metrics.path = os.path.splitext(path)[0] + '_metrics.jsonl'
+
+    if args.expand:
+        try:
+            expand(sqlite3.connect(args.expand).cursor(), c, args.max_distance)
+        except ValueError as e:
+            parser.error(f"{args.expand}: {e}")
+        conn.commit()
+        print_progress(c)
+        return
 
-    initialize(c)
-
-    insert_curve(c, Curve.canonical(1), 0)
+    frontier = Frontier(load_strategy(args.strategy),
+                        args.max_vertices, args.max_distance)
+    if args.resume:
+        load_counts(c)
+        frontier.seed(c)
+    else:
+        initialize(c)
+        start_curve = curve_class(Curve.canonical(1))
+        if symmetry_reduced:
+            start_curve = start_curve.symmetry_reduced()[0]
+        insert_curve(c, start_curve, 0)
+
+    mib = lambda x: None if x is None else x * 2 ** 20
+    budget = Budget(args.max_seconds, mib(args.max_rss), mib(args.max_db_size),
+                    args.max_curves, path)
+    signal.signal(signal.SIGTERM, lambda *_: budget.stop('SIGTERM'))
+
+    if args.pipeline:
+        conn.commit()
+        reason = pipelined_crawl(path, frontier, budget=budget)
+    else:
+        reason = crawl(c, frontier, args.workers, budget=budget)
+        conn.commit()
+    metrics.emit(force=True)
+    print_progress(c)
+    if reason is not None:
+        print_budget_summary(c, budget)
+        sys.exit(EXIT_BUDGET)
 
-    for cid in unexplored_ids_bfs(c):
-        process_cid(c, cid)
 
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,22 @@
+from array import array
 from collections import deque, Counter
 from enum import Enum
 from itertools import combinations_with_replacement, combinations, count
 
+import face_codec
+from profiling import profiled
+
+
+# Symmetries of plane curves are bitmasks of these.
+REVERSE = 1
+MIRROR = 2
+SYMMETRIES = range(4)
+
+
+def symmetry_coset(symmetry, stabilizer):
+    """The least symmetry with the same effect on a curve with this stabilizer."""
+    return min(symmetry ^ s for s in SYMMETRIES if stabilizer >> s & 1)
+
 
 class Move(Enum):
     R1_CCW_ADD = 101
@@ -31,6 +46,20 @@ class Move(Enum):
         else:
             return Move(x + 1)
 
+    def transformed(self, symmetry):
+        """The move seen after applying a symmetry to both curves.
+
+        Reversal and mirror each exchange CCW and CW; J moves keep their
+        type.
+        """
+        x = self.value
+        if symmetry in (REVERSE, MIRROR):
+            if x // 100 == 1:
+                x += 2 if x <= 102 else -2
+            elif x // 100 == 3:
+                x += 4 if x <= 304 else -4
+        return Move(x)
+
     @classmethod
     def strange(cls, start_q, sign):
         x = {0:301, 3:302, 1:303, 2:304}[start_q]
@@ -39,6 +68,29 @@ class Move(Enum):
         return cls(x)
 
 
+MASK64 = (1 << 64) - 1
+
+
+def mix64(z):
+    """The splitmix64 finalizer, a bijection on 64-bit integers."""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+# (max_vertices, {canonical key: [(move, key, multiplicity)]}), read
+# from the neighbor table file when first needed
+_small_neighbors = None
+
+
+def small_neighbors():
+    global _small_neighbors
+    if _small_neighbors is None:
+        import neighbor_table
+        _small_neighbors = neighbor_table.load()
+    return _small_neighbors
+
+
 def cw_shift(order):
     a, b, c, d = order
     return (d, a, b, c)
@@ -49,11 +101,32 @@ def ccw_shift(order):
     return (b, c, d, a)
 
 
+def swap_faces(code, face_1, face_2):
+    """Exchange two face labels throughout a code."""
+    def swap(x):
+        if x == face_1:
+            return face_2
+        elif x == face_2:
+            return face_1
+        else:
+            return x
+
+    return (
+        tuple(swap(face) for face in pair)
+        for pair in code
+    )
+
+
 class Curve:
     OUT = -1
 
     def __init__(self, code):
         self._code = deque((left, right) for left, right in code)
+        # __hash__, once computed; methods only ever rotate the code
+        self._hash = None
+        # (code, face_index(), move_sites()) as of the last call; methods
+        # that rotate the code leave these stale until recomputed
+        self._index = None
 
     def __repr__(self):
         return "{}({})".format(
@@ -74,6 +147,44 @@ class Curve:
     def __iter__(self):
         return iter(self._code)
 
+    def mirror(self):
+        # reflection of the plane swaps left and right
+        return Curve((right, left) for left, right in self._code)
+
+    def transformed(self, symmetry):
+        c = self
+        if symmetry & REVERSE:
+            c = reversed(c)
+        if symmetry & MIRROR:
+            c = c.mirror()
+        return c
+
+    def symmetry_reduced(self):
+        """The representative of this curve's orbit under reversal and mirror.
+
+        Returns (representative, symmetry, stabilizer), where the
+        representative is Curve(self.transformed(symmetry).canonical_code())
+        and bit g of stabilizer is set when symmetry g fixes this curve.
+        """
+        code = list(self._code)
+        mirrored = [(y, x) for x, y in code]
+        # The code of transformed(g) for each g, without making the curves.
+        # Those that reach the least code are symmetry composed with the
+        # stabilizer, so the others need only be canonicalized as far as
+        # they lose.
+        best = None
+        for g, orbit_code in enumerate(
+                (code, mirrored[::-1], mirrored, code[::-1])):
+            least = self._canonical_code(orbit_code, best)
+            if least is None:
+                continue
+            if best is None or least < best:
+                best, symmetry, reaching = least, g, [g]
+            else:
+                reaching.append(g)
+        stabilizer = sum(1 << (g ^ symmetry) for g in reaching)
+        return Curve(best), symmetry, stabilizer
+
     def __eq__(self, other):
         if len(self) != len(other):
             return False
@@ -104,6 +215,11 @@ class Curve:
         return False
 
     def __hash__(self):
+        if self._hash is None:
+            self._hash = self._compute_hash()
+        return self._hash
+
+    def _compute_hash(self):
         lefts = Counter(x for (x, y) in self)
         rights = Counter(y for (x, y) in self)
 
@@ -124,6 +240,105 @@ class Curve:
 
         return hash(frozenset(consecutive_triples.items()))
 
+    def stable_hash(self):
+        """A hash like __hash__ that is the same in every process and
+        Python version, as a signed 64-bit integer.
+
+        batch_invariants.stable_hash() computes it for many curves at once.
+        """
+        lefts = Counter(x for (x, y) in self)
+        rights = Counter(y for (x, y) in self)
+
+        def face_code(x):
+            return mix64(lefts[x] | rights[x] << 20 | (x == self.OUT) << 40)
+
+        edge_codes = [mix64((3 * face_code(x) + face_code(y)) & MASK64)
+                      for (x, y) in self]
+
+        n = len(edge_codes)
+        total = 0
+        for i in range(n):
+            triple = mix64((mix64(edge_codes[(i - 2) % n])
+                            + edge_codes[(i - 1) % n]) & MASK64)
+            total += mix64((triple + edge_codes[i]) & MASK64)
+
+        h = mix64(total & MASK64)
+        return h - (1 << 64) if h >> 63 else h
+
+    def canonical_code(self):
+        """The least rotation of the code, after relabelling.
+
+        Faces are renumbered 0, 1, 2, ... in order of first appearance,
+        except OUT, which keeps its label. Two curves are equal exactly
+        when their canonical codes are equal.
+        """
+        return self._canonical_code(list(self._code))
+
+    def _canonical_code(self, code, bound=None):
+        """canonical_code() of a curve with the code given as a list, or
+        None if that is greater than bound."""
+        # The first pair relabels to (OUT, 0), (0, OUT) or (0, 1), in that
+        # order, so only rotations starting at the best of these can win.
+        starts = [i for i, (x, _) in enumerate(code) if x == self.OUT] \
+            or [i for i, (_, y) in enumerate(code) if y == self.OUT] \
+            or range(len(code))
+        best = bound
+        least = None
+        for i in starts:
+            labels = {self.OUT: Curve.OUT}
+            relabelled = []
+            # give up on a rotation at its first pair greater than best's
+            tied = best is not None
+            for x, y in code[i:] + code[:i]:
+                pair = (labels.setdefault(x, len(labels) - 1),
+                        labels.setdefault(y, len(labels) - 1))
+                if tied:
+                    other = best[len(relabelled)]
+                    if pair > other:
+                        break
+                    tied = pair == other
+                relabelled.append(pair)
+            else:
+                best = least = tuple(relabelled)
+        return least
+
+    def canonical_key(self):
+        """canonical_code() packed as bytes, for sorting and lookups."""
+        return Curve(self.canonical_code()).pack()
+
+    def dense_code(self):
+        """canonical_code() with OUT as 0 and the other faces 1, 2, ..."""
+        return tuple((x + 1, y + 1) for x, y in self.canonical_code())
+
+    def dense_key(self):
+        """dense_code() bit-packed by face_codec, the shortest key."""
+        return face_codec.encode([face for pair in self.dense_code()
+                                  for face in pair])
+
+    @classmethod
+    def from_dense_key(cls, key):
+        return cls.from_dense_labels(face_codec.decode(key)[0])
+
+    @classmethod
+    def from_dense_labels(cls, labels):
+        """The curve of a flat dense_code(), as face_codec decodes it."""
+        faces = [cls.OUT if face == 0 else face - 1 for face in labels]
+        return cls(zip(faces[0::2], faces[1::2]))
+
+    def pack(self):
+        """The code as native int32 values: left, right for each edge."""
+        return array('i', [face for pair in self._code for face in pair]).tobytes()
+
+    @classmethod
+    def unpack(cls, buffer):
+        """Inverse of pack(); buffer may be any bytes-like object."""
+        faces = memoryview(buffer).cast('B').cast('i')
+        return cls(zip(faces[0::2], faces[1::2]))
+
+    def __reduce__(self):
+        # pickle as the packed code, not a deque of tuples
+        return self.__class__.unpack, (self.pack(),)
+
     @classmethod
     def canonical(cls, w: int):
         if w >= 2:
@@ -163,12 +378,39 @@ class Curve:
         return len(self)//2
 
     def face_index(self):
+        if self._index is not None and self._index[0] == self._code:
+            return self._index[1]
         index = dict()
         for i, (x, y) in enumerate(self._code):
             index.setdefault(x, []).append((i, 0))
             index.setdefault(y, []).append((i, 1))
+        self._index = (self._code.copy(), index, None)
         return index
 
+    def move_sites(self):
+        """Where decreasing and strange moves can happen.
+
+        Maps 1, 2 and 3 to the face_index() locations of each inside face
+        with that many sides, keeping only the triangles with three
+        distinct vertices. Like face_index(), it is kept until the code
+        is rotated, so the generators using it look only at these sites.
+        """
+        index = self.face_index()
+        if self._index[2] is not None:
+            return self._index[2]
+
+        sites = {1: [], 2: [], 3: []}
+        for face, locations in index.items():
+            if face != self.OUT and len(locations) in sites:
+                sites[len(locations)].append(locations)
+        sites[3] = [
+            triangle for triangle in sites[3]
+            if all(self._index_distance(i1, i2) > 1
+                   for (i1, _), (i2, _) in combinations(triangle, 2))
+        ]
+        self._index = self._index[:2] + (sites,)
+        return sites
+
     def source_quadruple(self, i):
         code = self._code
         n = len(code)
@@ -193,6 +435,7 @@ class Curve:
             assert d == 2*n
             return -1
 
+    @profiled
     def increasing_r1_neighbors(self):
         """For each edge, you can make a new loop on the left or on the right."""
         code = self._code.copy()
@@ -224,6 +467,7 @@ class Curve:
 
             code.rotate(1)
 
+    @profiled
     def decreasing_r1_neighbors(self):
         """Find an empty 1-gon"""
 
@@ -252,17 +496,14 @@ class Curve:
             return
 
 
-        for _ in range(len(code)):
-            result = is_empty_1_gon(code[-1], code[0], code[1])
+        code = list(code)
+        for ((i, _),) in self.move_sites()[1]:
+            rotated = code[i - 1:] + code[:i - 1]
+            result = is_empty_1_gon(*rotated[:3])
             if result == +1:
-                code_iter = iter(code)
-                next(code_iter), next(code_iter)
-                yield (Move.R1_CCW_REMOVE, Curve(code_iter))
+                yield (Move.R1_CCW_REMOVE, Curve(rotated[3:] + rotated[:1]))
             elif result == -1:
-                code_iter = iter(code)
-                next(code_iter), next(code_iter)
-                yield (Move.R1_CW_REMOVE, Curve(code_iter))
-            code.rotate(1)
+                yield (Move.R1_CW_REMOVE, Curve(rotated[3:] + rotated[:1]))
 
     def face_iterator(self, start_i, start_j):
         code = self._code
@@ -294,6 +535,7 @@ class Curve:
             if i == start_i:
                 break
 
+    @profiled
     def increasing_j_neighbors(self, index=None):
         if len(self) == 1:
             triple_eight = Curve([(0, -1), (-1, 1), (2, -1), (-1, 1)])
@@ -316,20 +558,6 @@ class Curve:
         C = 1 + max(face for pair in self for face in pair)
         D = C + 1
 
-        def swap_out(code, new_out):
-            def swap(x):
-                if x == self.OUT:
-                    return new_out
-                elif x == new_out:
-                    return self.OUT
-                else:
-                    return x
-
-            return (
-                tuple(swap(face) for face in pair)
-                for pair in code
-            )
-
         def ways_to_link_edges(edge_1, edge_2):
             code = list(self)
             if edge_1 == edge_2:
@@ -343,7 +571,7 @@ class Curve:
                 code[i:i + 1] = list(zip(col_1, col_2))
                 yield (Move.J_MINUS_ADD, Curve(code))
                 if A == self.OUT:
-                    yield (Move.J_MINUS_ADD, Curve(swap_out(code, D)))
+                    yield (Move.J_MINUS_ADD, Curve(swap_faces(code, self.OUT, D)))
             else:
                 F0 = code[edge_1[0]][edge_1[1]]
                 assert F0 == code[edge_2[0]][edge_2[1]]
@@ -376,20 +604,18 @@ class Curve:
                 sign = Move.J_MINUS_ADD if edge_1[1] == edge_2[1] else Move.J_PLUS_ADD
                 yield (sign, Curve(code))
                 if F0 == self.OUT:
-                    yield (sign, Curve(swap_out(code, D)))
+                    yield (sign, Curve(swap_faces(code, self.OUT, D)))
 
         for face_list in index.values():
             for edge_1, edge_2 in combinations_with_replacement(face_list, 2):
                 yield from ways_to_link_edges(edge_1, edge_2)
 
-    def decreasing_j_neighbors(self, index=None):
+    @profiled
+    def decreasing_j_neighbors(self):
         if len(self) <= 2:
             # canonical 2-curve does not have any separable bigons.
             return
-        if index is None:
-            index = self.face_index()
-        bigons = [locations for face, locations in index.items()
-                  if len(locations) == 2 and face != self.OUT]
+        bigons = self.move_sites()[2]
 
         if bigons and len(self) == 4:
             triple_eight = Curve([(0, -1), (-1, 1), (2, -1), (-1, 1)])
@@ -432,20 +658,10 @@ class Curve:
         for (i1, j1), (i2, j2) in bigons:
             yield separated_bigons(i1, j1, i2, j2)
 
-    def strange_neighbors(self, index=None):
-        if index is None:
-            index = self.face_index()
-        triangles = [locations for face, locations in index.items()
-                     if len(locations) == 3 and face != self.OUT]
-
+    @profiled
+    def strange_neighbors(self):
         n = len(self)
-        for (i1, j1), (i2, j2), (i3, j3) in triangles:
-
-            if any(self._index_distance(*pair) <= 1
-                   for pair in combinations([i1, i2, i3], 2)):
-                # not three distinct vertices, doesn't count
-                continue
-
+        for (i1, j1), (i2, j2), (i3, j3) in self.move_sites()[3]:
             code = list(self)
 
             F0 = code[i1][j1]
@@ -485,13 +701,35 @@ class Curve:
 
             yield (move_code, Curve(code))
 
-    def neighbors(self):
-        yield from self.decreasing_r1_neighbors()
-        index = self.face_index()
-        yield from self.decreasing_j_neighbors(index)
-        yield from self.strange_neighbors(index)
-        yield from self.increasing_j_neighbors(index)
-        yield from self.increasing_r1_neighbors()
+    @profiled
+    def neighbors(self, moves=None):
+        """Yield (move, curve) for each way to make each move, or only
+        the moves in a given set.
+
+        Plane curves small enough to be in the neighbor table are looked
+        up there; see neighbor_table.py.
+        """
+        max_vertices, table = small_neighbors()
+        if self.OUT == Curve.OUT and len(self) <= 2 * max_vertices:
+            entries = table.get(self.canonical_key())
+            if entries is not None:
+                for move, key, multiplicity in entries:
+                    if moves is None or move in moves:
+                        for _ in range(multiplicity):
+                            yield move, Curve.unpack(key)
+                return
+        yield from self.generated_neighbors(moves)
+
+    def generated_neighbors(self, moves=None):
+        """neighbors(), always from the move generators, running only
+        those that make some of the moves."""
+        for name, made in GENERATORS:
+            if moves is None:
+                yield from getattr(self, name)()
+            elif made & moves:
+                for move, c in getattr(self, name)():
+                    if move in moves:
+                        yield move, c
 
     def gauss_code(self):
         quadruples = []
@@ -533,3 +771,240 @@ class Curve:
             assert (cw_shift(q) in quadruples) ^ (ccw_shift(q) in quadruples)
 
         return True
+
+
+# Each move generator, in the order neighbors() runs them, with the
+# moves it makes.
+GENERATORS = (
+    ('decreasing_r1_neighbors', {Move.R1_CCW_REMOVE, Move.R1_CW_REMOVE}),
+    ('decreasing_j_neighbors', {Move.J_PLUS_REMOVE, Move.J_MINUS_REMOVE}),
+    ('strange_neighbors', {m for m in Move if m.value // 100 == 3}),
+    ('increasing_j_neighbors', {Move.J_PLUS_ADD, Move.J_MINUS_ADD}),
+    ('increasing_r1_neighbors', {Move.R1_CCW_ADD, Move.R1_CW_ADD}),
+)
+
+# Bump whenever a change to the generators, or to anything they call,
+# changes the neighbors they yield. Neighbor tables built at another
+# version are not used.
+GENERATORS_VERSION = 1
+
+
+class SphericalCurve(Curve):
+    """A curve on the sphere, where no face is the outside.
+
+    OUT is a label that never occurs, so equality, hashing and the move
+    generators treat every face alike. Choosing any one of the faces as
+    the outside gives a plane curve; see plane_curves().
+    """
+    OUT = None
+
+    def whitney(self):
+        # Not defined without an outside face.
+        return None
+
+    def plane_curves(self):
+        """Yield each distinct plane curve with this curve as its sphere.
+
+        Larger faces come first, so the first plane curve has as few
+        moves as possible hidden by its outside face.
+        """
+        index = self.face_index()
+        seen = set()
+        for face in sorted(index, key=lambda f: -len(index[f])):
+            c = Curve(swap_faces(self, face, Curve.OUT))
+            key = c.canonical_code()
+            if key not in seen:
+                seen.add(key)
+                yield c
+
+    # The plane generators special-case curves of up to two vertices by
+    # their Whitney index and outside face; these are the same cases with
+    # every face alike.
+
+    def increasing_r1_neighbors(self):
+        if len(self) != 1:
+            yield from super().increasing_r1_neighbors()
+            return
+        eight = SphericalCurve(Curve.canonical(0))
+        yield (Move.R1_CCW_ADD, eight)
+        yield (Move.R1_CW_ADD, eight)
+
+    def decreasing_r1_neighbors(self):
+        if len(self) > 2:
+            yield from super().decreasing_r1_neighbors()
+            return
+        # either loop of the figure eight, leaving the pair before it
+        code = self._code
+        for ((i, _),) in self.move_sites()[1]:
+            pair1, pair2 = code[i - 1], code[i]
+            if pair1[0] == pair2[1]:
+                yield (Move.R1_CCW_REMOVE, SphericalCurve([pair1]))
+            elif pair1[1] == pair2[0]:
+                yield (Move.R1_CW_REMOVE, SphericalCurve([pair1]))
+
+    def increasing_j_neighbors(self, index=None):
+        if len(self) != 1:
+            yield from super().increasing_j_neighbors(index)
+            return
+        # one in each face of the circle, giving mirror images
+        yield (Move.J_MINUS_ADD,
+               SphericalCurve([(0, -1), (-1, 1), (2, -1), (-1, 1)]))
+        yield (Move.J_MINUS_ADD,
+               SphericalCurve([(0, -1), (1, 0), (0, 2), (1, 0)]))
+
+    def decreasing_j_neighbors(self):
+        if len(self) != 4:
+            yield from super().decreasing_j_neighbors()
+            return
+        # removing a bigon of a two vertex curve leaves the circle
+        for (i1, j1), (i2, j2) in self.move_sites()[2]:
+            yield (Move.J_MINUS_REMOVE if j1 == j2 else Move.J_PLUS_REMOVE,
+                   SphericalCurve(Curve.canonical(1)))
+
+    def neighbors(self, moves=None):
+        for move, c in super().neighbors(moves):
+            yield (move, SphericalCurve(c))
+
+
+class CurveSet:
+    """A set of curves, stored as dense keys in one bytearray.
+
+    An open addressing table over the keys replaces __hash__ and __eq__,
+    so each curve costs its dense key plus about 16 bytes, and no Curve
+    objects are kept. Curves come back as cls when iterated.
+    """
+
+    def __init__(self, curves=(), cls=Curve):
+        self.cls = cls
+        self._data = bytearray()
+        # key i is _data[_offsets[i]:_offsets[i + 1]]
+        self._offsets = array('q', [0])
+        # key index or -1; at most half full
+        self._slots = array('i', [-1]) * 8
+        self.add_many(curves)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _find(self, key):
+        """(slot, index) of key, with index -1 if it is absent."""
+        data, offsets, slots = self._data, self._offsets, self._slots
+        mask = len(slots) - 1
+        slot = hash(key) & mask
+        while True:
+            i = slots[slot]
+            if i < 0 or data[offsets[i]:offsets[i + 1]] == key:
+                return slot, i
+            slot = (slot + 1) & mask
+
+    def _add_key(self, key):
+        """(index, whether it is new) of key, adding it if absent."""
+        slot, i = self._find(key)
+        if i >= 0:
+            return i, False
+        i = len(self)
+        self._data += key
+        self._offsets.append(len(self._data))
+        self._slots[slot] = i
+        if 2 * len(self) > len(self._slots):
+            self._rebuild(2 * len(self._slots))
+        return i, True
+
+    def _rebuild(self, size):
+        # hash() of bytes differs between processes, so this is also
+        # how an unpickled set gets its table
+        self._slots = slots = array('i', [-1]) * size
+        mask = size - 1
+        for i, key in enumerate(self.keys()):
+            slot = hash(key) & mask
+            while slots[slot] >= 0:
+                slot = (slot + 1) & mask
+            slots[slot] = i
+
+    def add(self, curve):
+        self._add_key(curve.dense_key())
+
+    def add_many(self, curves):
+        """Add each curve; return how many were new."""
+        return sum(self._add_key(c.dense_key())[1] for c in curves)
+
+    def __contains__(self, curve):
+        return self._find(curve.dense_key())[1] >= 0
+
+    def contains_many(self, curves):
+        return [self._find(c.dense_key())[1] >= 0 for c in curves]
+
+    def keys(self):
+        """The dense key of each curve, in the order added."""
+        data, offsets = self._data, self._offsets
+        for i in range(len(self)):
+            yield bytes(data[offsets[i]:offsets[i + 1]])
+
+    def __iter__(self):
+        for key in self.keys():
+            yield self.cls.from_dense_key(key)
+
+    def __getstate__(self):
+        return {'cls': self.cls, 'data': bytes(self._data),
+                'offsets': self._offsets}
+
+    def __setstate__(self, state):
+        self.cls = state['cls']
+        self._data = bytearray(state['data'])
+        self._offsets = state['offsets']
+        size = 8
+        while 2 * len(self) > size:
+            size *= 2
+        self._rebuild(size)
+
+
+class CurveMap(CurveSet):
+    """A mapping from curves to values, stored like CurveSet.
+
+    Values are kept in an array of typecode, or in a list if typecode
+    is None.
+    """
+
+    def __init__(self, items=(), cls=Curve, typecode='q'):
+        self.typecode = typecode
+        self._values = [] if typecode is None else array(typecode)
+        super().__init__(cls=cls)
+        for curve, value in items:
+            self[curve] = value
+
+    def _add_key(self, key):
+        i, new = super()._add_key(key)
+        if new:
+            self._values.append(0 if self.typecode else None)
+        return i, new
+
+    def __setitem__(self, curve, value):
+        i, _ = self._add_key(curve.dense_key())
+        self._values[i] = value
+
+    def __getitem__(self, curve):
+        i = self._find(curve.dense_key())[1]
+        if i < 0:
+            raise KeyError(curve)
+        return self._values[i]
+
+    def get(self, curve, default=None):
+        i = self._find(curve.dense_key())[1]
+        return default if i < 0 else self._values[i]
+
+    def values(self):
+        return iter(self._values)
+
+    def items(self):
+        return zip(self, self._values)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['typecode'] = self.typecode
+        state['values'] = self._values
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.typecode = state['typecode']
+        self._values = state['values']
@@ -0,0 +1,183 @@
+"""Breadth first crawl on disk, with delayed duplicate detection.
+
+No curve is looked up by hash. The curves at each distance live in a
+level file sorted by canonical key. Exploring a level writes every
+neighbor as (key, parent id, move) to runs of at most run_size records,
+each sorted in memory and written out in one pass. The runs are merged
+and read in key order alongside the two previous levels. Every curve
+adjacent to level d is at distance d - 1, d or d + 1, so keys found
+there already have ids, and the rest become level d + 1 in the same
+pass. Memory holds one run; all disk access is sequential.
+
+Files in the work directory:
+
+    level_D.bin     (id, key) for the curves at distance D, by key
+    edges.bin       (start id, end id, move, multiplicity) per move found
+
+load_database() builds an ordinary crawl database from them.
+
+    python external_bfs.py WORKDIR --max-distance 8 [--db ipc.db]
+"""
+import argparse
+import heapq
+import os
+import sqlite3
+import struct
+from collections import Counter
+from itertools import groupby
+
+from create_db import initialize, insert_curve, record_move
+from curve_code import Curve, Move
+
+LEVEL = struct.Struct('<QI')     # id, key length; then the key
+RUN = struct.Struct('<QHI')      # parent id, move, key length; then the key
+EDGE = struct.Struct('<QQHI')    # start id, end id, move, multiplicity
+
+
+def level_path(directory, d):
+    return os.path.join(directory, f'level_{d}.bin')
+
+
+def _read_records(path, header):
+    """Yield (key, *fields) for records of header followed by a key."""
+    with open(path, 'rb') as f:
+        while True:
+            fixed = f.read(header.size)
+            if not fixed:
+                return
+            *fields, length = header.unpack(fixed)
+            yield (f.read(length), *fields)
+
+
+def read_level(directory, d):
+    """Yield (key, id) for the curves at distance d, by key."""
+    path = level_path(directory, d)
+    if d < 0 or not os.path.exists(path):
+        return iter(())
+    return _read_records(path, LEVEL)
+
+
+def _write_run(path, records):
+    records.sort()
+    with open(path, 'wb') as f:
+        for key, parent, move in records:
+            f.write(RUN.pack(parent, move, len(key)))
+            f.write(key)
+    records.clear()
+
+
+def _neighbor_runs(directory, d, run_size):
+    """Write the neighbors of level d to sorted runs; return their paths."""
+    paths = []
+    records = []
+    for key, cid in read_level(directory, d):
+        for move, c2 in Curve.unpack(key).neighbors():
+            records.append((c2.canonical_key(), cid, move.value))
+            if len(records) >= run_size:
+                paths.append(os.path.join(directory, f'run_{len(paths)}.bin'))
+                _write_run(paths[-1], records)
+    if records:
+        paths.append(os.path.join(directory, f'run_{len(paths)}.bin'))
+        _write_run(paths[-1], records)
+    return paths
+
+
+def expand_level(directory, d, next_id, run_size=1_000_000):
+    """Explore level d, writing level d + 1 and appending its edges.
+
+    Returns the next unused id.
+    """
+    runs = _neighbor_runs(directory, d, run_size)
+    neighbors = heapq.merge(*(_read_records(path, RUN) for path in runs))
+    known = heapq.merge(read_level(directory, d - 1), read_level(directory, d))
+    known_key, known_id = next(known, (None, None))
+
+    with open(level_path(directory, d + 1), 'wb') as level, \
+            open(os.path.join(directory, 'edges.bin'), 'ab') as edges:
+        for key, records in groupby(neighbors, key=lambda r: r[0]):
+            while known_key is not None and known_key < key:
+                known_key, known_id = next(known, (None, None))
+            if key == known_key:
+                cid = known_id
+            else:
+                cid = next_id
+                next_id += 1
+                level.write(LEVEL.pack(cid, len(key)))
+                level.write(key)
+
+            moves = Counter((parent, move) for _, parent, move in records)
+            for (parent, move), multiplicity in moves.items():
+                edges.write(EDGE.pack(parent, cid, move, multiplicity))
+
+    for path in runs:
+        os.remove(path)
+    return next_id
+
+
+def crawl(directory, max_distance=None, run_size=1_000_000):
+    """Crawl from the circle until a level is empty or max_distance has
+    been explored."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith('level_') or name == 'edges.bin':
+            os.remove(os.path.join(directory, name))
+
+    start = Curve(Curve.canonical(1)).canonical_key()
+    with open(level_path(directory, 0), 'wb') as f:
+        f.write(LEVEL.pack(1, len(start)))
+        f.write(start)
+
+    next_id = 2
+    d = 0
+    while max_distance is None or d <= max_distance:
+        count = next_id
+        next_id = expand_level(directory, d, next_id, run_size)
+        d += 1
+        print(f"distance {d}: {next_id - count} curves")
+        if next_id == count:
+            break
+
+
+def load_database(directory, c):
+    """Fill a new crawl database from the level and edge files.
+
+    Curves get the ids they have on disk. The last level is unexplored.
+    """
+    initialize(c)
+    levels = 0
+    while os.path.exists(level_path(directory, levels)):
+        levels += 1
+    for d in range(levels):
+        # ids are handed out in key order, so this is also id order
+        for key, cid in read_level(directory, d):
+            inserted = insert_curve(c, Curve.unpack(key), d)
+            assert inserted == cid
+
+    c.execute("""
+        UPDATE curve SET explored = 1 WHERE distance < ?
+    """, (levels - 1,))
+
+    with open(os.path.join(directory, 'edges.bin'), 'rb') as f:
+        while record := f.read(EDGE.size):
+            start_id, end_id, move, multiplicity = EDGE.unpack(record)
+            record_move(c, start_id, end_id, Move(move), multiplicity)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--max-distance', type=int)
+    parser.add_argument('--run-size', type=int, default=1_000_000,
+                        help='neighbors sorted in memory at a time')
+    parser.add_argument('--db', help='load the result into this database')
+    args = parser.parse_args(argv)
+
+    crawl(args.directory, args.max_distance, args.run_size)
+    if args.db:
+        conn = sqlite3.connect(args.db)
+        load_database(args.directory, conn.cursor())
+        conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""The move graph as CSR arrays, for whole-graph analysis with NumPy.
+
+export_csr() writes, into a directory:
+
+    curve_ids.npy      database id of each dense vertex 0 .. N-1
+    indptr.npy         edges of vertex i are indptr[i]:indptr[i+1]
+    indices.npy        dense end vertex of each edge
+    move_type.npy      Move value of each edge
+    multiplicity.npy   multiplicity of each edge
+
+Edges come from the all_moves view, so both directions of a move appear.
+
+    python move_graph.py ipc.db graph/
+"""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+ARRAYS = ('curve_ids', 'indptr', 'indices', 'move_type', 'multiplicity')
+
+
+def _fetch_columns(c, query, columns, dtype, chunk_size=1_000_000):
+    c.execute(query)
+    chunks = []
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=dtype).reshape(-1, columns))
+    if not chunks:
+        return np.empty((0, columns), dtype=dtype)
+    return np.concatenate(chunks)
+
+
+def export_csr(c, directory):
+    curve_ids = _fetch_columns(
+        c, "SELECT id FROM curve ORDER BY id", 1, np.int64)[:, 0]
+    edges = _fetch_columns(c, """
+        SELECT start_curve_id, end_curve_id, type_id, multiplicity
+        FROM all_moves
+    """, 4, np.int64)
+
+    start = np.searchsorted(curve_ids, edges[:, 0])
+    end = np.searchsorted(curve_ids, edges[:, 1])
+    order = np.lexsort((end, start))
+
+    indptr = np.zeros(len(curve_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(start, minlength=len(curve_ids)), out=indptr[1:])
+
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        'curve_ids': curve_ids,
+        'indptr': indptr,
+        'indices': end[order].astype(np.int32),
+        'move_type': edges[order, 2].astype(np.int16),
+        'multiplicity': edges[order, 3].astype(np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+
+
+def load_csr(directory, mmap_mode='r'):
+    """The exported arrays by name, memory-mapped by default."""
+    return {
+        name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+        for name in ARRAYS
+    }
+
+
+def edge_sources(indptr):
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+def _neighbors_of(indptr, indices, vertices):
+    starts = indptr[vertices]
+    counts = indptr[vertices + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return indices[np.arange(counts.sum()) + offsets]
+
+
+def bfs(indptr, indices, source):
+    """Distance of every dense vertex from source along edges, -1 if none."""
+    distance = np.full(len(indptr) - 1, -1, dtype=np.int64)
+    distance[source] = 0
+    frontier = np.array([source])
+    d = 0
+    while len(frontier):
+        d += 1
+        reached = _neighbors_of(indptr, indices, frontier)
+        frontier = np.unique(reached[distance[reached] < 0])
+        distance[frontier] = d
+    return distance
+
+
+def connected_components(indptr, indices):
+    """Label of each vertex's component, ignoring edge direction.
+
+    Labels are the least vertex in the component.
+    """
+    labels = np.arange(len(indptr) - 1)
+    src = edge_sources(indptr)
+    dst = np.asarray(indices)
+    while True:
+        lowest = np.minimum(labels[src], labels[dst])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, src, lowest)
+        np.minimum.at(new_labels, dst, lowest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def degree_distribution(indptr, multiplicity=None):
+    """counts[k] is the number of vertices with out-degree k.
+
+    With multiplicity, a move counts as many times as it can be made.
+    """
+    if multiplicity is None:
+        degrees = np.diff(indptr)
+    else:
+        degrees = np.add.reduceat(np.append(multiplicity, 0), indptr[:-1])
+        degrees[np.diff(indptr) == 0] = 0
+    return np.bincount(degrees)
+
+
+if __name__ == '__main__':
+    export_csr(sqlite3.connect(sys.argv[1]).cursor(), sys.argv[2])
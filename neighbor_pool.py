@@ -0,0 +1,254 @@
+"""Neighbor generation in worker processes, returned through shared memory.
+
+Each worker has a block of shared memory split into slots. It writes
+the packed neighbors of each curve it is given into its slots as
+
+    record    item id, neighbors in this record, 1 if the item's last
+    neighbor  move, code length, then the pack()ed code
+
+and sends only (slot, bytes used) through a queue; a semaphore counts
+the slots the parent has finished reading. The parent hands out work
+round robin and reads each worker's slots in order, so results come
+back in the order given without buffering, as memoryviews straight
+into the slots.
+"""
+import multiprocessing
+import signal
+import struct
+from collections import deque
+from itertools import islice
+from multiprocessing import shared_memory
+
+from curve_code import Curve, Move
+
+RECORD = struct.Struct('<qII')
+NEIGHBOR = struct.Struct('<HI')
+
+
+class _SlotWriter:
+    """Writes records into one worker's slots, in turn."""
+
+    def __init__(self, buf, slots, slot_size, free, results):
+        self.buf = buf
+        self.slots = slots
+        self.slot_size = slot_size
+        self.free = free
+        self.results = results
+        self.slot = -1
+        self.used = None
+
+    def _take(self):
+        self.free.acquire()
+        self.slot = (self.slot + 1) % self.slots
+        self.used = 0
+
+    def send(self):
+        """Hand the slot being written to the parent, if any."""
+        if self.used:
+            self.results.put((self.slot, self.used))
+        self.used = None
+
+    def write_item(self, item_id, neighbors):
+        """Write (move value, packed code) pairs for one item, over as
+        many records and slots as they need."""
+        i = 0
+        while True:
+            if self.used is None or self.used + RECORD.size > self.slot_size:
+                self.send()
+                self._take()
+            base = self.slot * self.slot_size
+            header = self.used
+            self.used += RECORD.size
+            count = 0
+            while i < len(neighbors):
+                move, code = neighbors[i]
+                end = self.used + NEIGHBOR.size + len(code)
+                if end > self.slot_size:
+                    break
+                NEIGHBOR.pack_into(self.buf, base + self.used, move, len(code))
+                self.buf[base + self.used + NEIGHBOR.size:base + end] = code
+                self.used = end
+                count += 1
+                i += 1
+            last = i == len(neighbors)
+            if not count and not last:
+                if header == 0:
+                    raise ValueError("slot_size is too small for a neighbor")
+                # start the item over in a new slot
+                self.used = header
+                self.send()
+                continue
+            RECORD.pack_into(self.buf, base + header, item_id, count, last)
+            if last:
+                return
+            self.send()
+
+
+def _worker(shm, slots, slot_size, free, tasks, results, cls, moves):
+    # a handler the parent installed would keep terminate() from working
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    writer = _SlotWriter(shm.buf, slots, slot_size, free, results)
+    while (task := tasks.get()) is not None:
+        try:
+            for item_id, code in task:
+                writer.write_item(item_id, [
+                    (move.value, c.pack())
+                    for move, c in cls.unpack(code).neighbors(moves)
+                ])
+            writer.send()
+        except Exception as e:
+            # slot -1 carries the error to the parent instead
+            results.put((-1, e))
+            return
+
+
+class NeighborPool:
+    """Worker processes that generate curve neighbors, of every move or
+    only those in moves.
+
+    Use as a context manager. imap() may be called any number of times.
+    """
+
+    def __init__(self, workers, cls=Curve, slots=4, slot_size=1 << 20,
+                 moves=None):
+        if slots < 2:
+            raise ValueError("a worker needs a slot while one is being read")
+        self.cls = cls
+        self.slots = slots
+        self.slot_size = slot_size
+        self._shm = []
+        self._free = []
+        self._tasks = []
+        self._results = []
+        self._processes = []
+        # of the last imap(), closed with the pool if it is left unfinished
+        self._readers = []
+        self._closed = False
+        for _ in range(workers):
+            shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+            free = multiprocessing.Semaphore(slots)
+            tasks = multiprocessing.Queue()
+            results = multiprocessing.Queue()
+            p = multiprocessing.Process(
+                target=_worker, daemon=True,
+                args=(shm, slots, slot_size, free, tasks, results, cls, moves))
+            p.start()
+            self._shm.append(shm)
+            self._free.append(free)
+            self._tasks.append(tasks)
+            self._results.append(results)
+            self._processes.append(p)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        for reader in self._readers:
+            reader.close()
+        for tasks in self._tasks:
+            tasks.put(None)
+        for p in self._processes:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        for shm in self._shm:
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:
+                # codes from the last item are still referenced; the
+                # mapping goes when they do
+                pass
+        self._shm.clear()
+
+    def _records(self, w):
+        """Yield (item id, [(move value, code)], last) from worker w's
+        slots, releasing each once everything in it has been handed on.
+
+        Records of an item that goes on into the next slot are copied out,
+        since the worker may need every slot to finish it.
+        """
+        buf = self._shm[w].buf
+        free = self._free[w]
+        while True:
+            slot, used = self._results[w].get()
+            if slot < 0:
+                raise used
+            base = slot * self.slot_size
+            offset = 0
+            try:
+                while offset < used:
+                    item_id, count, last = RECORD.unpack_from(buf, base + offset)
+                    offset += RECORD.size
+                    neighbors = []
+                    for _ in range(count):
+                        move, length = NEIGHBOR.unpack_from(buf, base + offset)
+                        offset += NEIGHBOR.size
+                        code = buf[base + offset:base + offset + length]
+                        neighbors.append((move, code if last else bytes(code)))
+                        offset += length
+                    try:
+                        yield item_id, neighbors, last
+                    finally:
+                        if last:
+                            for _, code in neighbors:
+                                code.release()
+                    del neighbors
+            finally:
+                free.release()
+
+    def _next_item(self, reader):
+        neighbors = []
+        while True:
+            item_id, part, last = next(reader)
+            neighbors.extend(part)
+            if last:
+                return item_id, neighbors
+
+    def imap(self, items, chunk_size=16):
+        """Yield (item id, [(move, code)]) for each (item id, curve) in
+        items, in order. The codes are memoryviews into shared memory,
+        released when the next item is asked for; pass them to
+        cls.unpack() to keep them.
+        """
+        workers = len(self._processes)
+        items = iter(items)
+        readers = self._readers = [self._records(w) for w in range(workers)]
+        # [worker, items not yet read] of each chunk handed out, in order
+        pending = deque()
+        chunk_id = 0
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    chunk = [(item_id, curve.pack())
+                             for item_id, curve in islice(items, chunk_size)]
+                    if not chunk:
+                        break
+                    w = chunk_id % workers
+                    self._tasks[w].put(chunk)
+                    pending.append([w, len(chunk)])
+                    chunk_id += 1
+                if not pending:
+                    return
+                w = pending[0][0]
+                while pending[0][1]:
+                    pending[0][1] -= 1
+                    item_id, neighbors = self._next_item(readers[w])
+                    yield item_id, [(Move(move), code) for move, code in neighbors]
+                pending.popleft()
+        except GeneratorExit:
+            # read past whatever was handed out, so the next imap() starts
+            # on a clean slate; a closed pool has no next imap()
+            if self._closed:
+                raise
+            for w, count in pending:
+                for _ in range(count):
+                    self._next_item(readers[w])
+            raise
+        finally:
+            for reader in readers:
+                reader.close()
@@ -0,0 +1,136 @@
+"""Precomputed neighbors of every plane curve with few vertices.
+
+Curve.neighbors() looks small curves up by canonical key in this table
+instead of running the move generators. The table file holds
+
+    header    magic, generators version, max vertices, number of keys,
+              number of curves
+    keys      every canonical key used, each as a length and the bytes
+    entries   per curve: its key's index and entry count, then
+              (move, neighbor key's index, multiplicity) per entry
+
+The version is curve_code.GENERATORS_VERSION at the time of the build.
+A table of another version, or none at all, is not used: every curve
+runs the generators until the table is rebuilt, which is a separate
+step (about 9 seconds):
+
+    python neighbor_table.py [--max-vertices 5] [--output PATH]
+"""
+import argparse
+import os
+import struct
+from collections import Counter
+
+import curve_code
+from curve_code import Curve, Move
+
+MAGIC = b'IPCNBR03'
+HEADER = struct.Struct('<8sIIII')
+KEY = struct.Struct('<I')
+CURVE = struct.Struct('<II')
+ENTRY = struct.Struct('<HII')
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'neighbor_table.bin')
+DEFAULT_MAX_VERTICES = 5
+
+
+def build(max_vertices):
+    """Map each canonical key with at most max_vertices vertices to its
+    [(move, neighbor key, multiplicity)], from the move generators."""
+    from count_curves import plane_curves
+
+    table = dict()
+    for n in range(max_vertices + 1):
+        for curve in plane_curves(n):
+            key = curve.canonical_key()
+            moves = Counter(
+                (move, c2.canonical_key())
+                for move, c2 in Curve.unpack(key).generated_neighbors()
+            )
+            table[key] = [(move, k, m) for (move, k), m in moves.items()]
+    return table
+
+
+def write(table, max_vertices, path=DEFAULT_PATH):
+    keys = dict()
+    for key, entries in table.items():
+        keys.setdefault(key, len(keys))
+        for _, k, _ in entries:
+            keys.setdefault(k, len(keys))
+
+    # moved into place whole, so that no process reads half a table
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, curve_code.GENERATORS_VERSION, max_vertices,
+                            len(keys), len(table)))
+        for key in keys:
+            f.write(KEY.pack(len(key)))
+            f.write(key)
+        for key, entries in table.items():
+            f.write(CURVE.pack(keys[key], len(entries)))
+            for move, k, multiplicity in entries:
+                f.write(ENTRY.pack(move.value, keys[k], multiplicity))
+    os.replace(tmp, path)
+
+
+def read(path=DEFAULT_PATH):
+    """(max_vertices, table) from a table file.
+
+    Raises ValueError if the file is not a table built from the current
+    move generators.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, max_vertices, num_keys, num_curves = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a neighbor table")
+    if version != curve_code.GENERATORS_VERSION:
+        raise ValueError(f"{path} is from move generators version {version}")
+
+    offset = HEADER.size
+    keys = []
+    for _ in range(num_keys):
+        (length,) = KEY.unpack_from(data, offset)
+        offset += KEY.size
+        keys.append(data[offset:offset + length])
+        offset += length
+
+    table = dict()
+    for _ in range(num_curves):
+        index, count = CURVE.unpack_from(data, offset)
+        offset += CURVE.size
+        entries = []
+        for move, k, multiplicity in ENTRY.iter_unpack(
+                data[offset:offset + count * ENTRY.size]):
+            entries.append((Move(move), keys[k], multiplicity))
+        offset += count * ENTRY.size
+        table[keys[index]] = entries
+    return max_vertices, table
+
+
+def load(path=DEFAULT_PATH):
+    """read(path), or (-1, {}) if there is no usable table, so that no
+    curve is looked up. Nothing is built or written here."""
+    try:
+        return read(path)
+    except (OSError, ValueError, struct.error):
+        return -1, dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-vertices', type=int,
+                        default=DEFAULT_MAX_VERTICES)
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    table = build(args.max_vertices)
+    write(table, args.max_vertices, args.output)
+    print(f"{len(table)} curves, "
+          f"{sum(len(e) for e in table.values())} entries, "
+          f"{os.path.getsize(args.output)} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Opt-in wall-time profiling for long crawls.
+
+Functions decorated with @profiled cost one flag check per call until
+profiling is turned on, either with the IPC_PROFILE environment variable
+or with enable(path). From then on, the self time and call count of each
+stack of profiled functions is recorded, and at exit the times are
+written to the path in collapsed-stack format (one "a;b;c microseconds"
+line per stack, as read by flamegraph.pl and speedscope), with the call
+counts beside it in path + ".calls".
+
+Generators are timed inside each step, so a move generator appears below
+whatever consumed it.
+"""
+import atexit
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import Counter
+
+enabled = False
+path = None
+
+# [name, seconds spent in profiled callees] per active call, per thread
+_local = threading.local()
+self_times = Counter()
+calls = Counter()
+
+
+def enable(output_path):
+    global enabled, path
+    if path is None:
+        atexit.register(dump)
+    path = output_path
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def _thread_stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _enter(name):
+    _thread_stack().append([name, 0.0])
+    return time.perf_counter()
+
+
+def _exit(t0, new_call):
+    elapsed = time.perf_counter() - t0
+    _stack = _thread_stack()
+    key = ';'.join(frame[0] for frame in _stack)
+    _, callees = _stack.pop()
+    self_times[key] += elapsed - callees
+    if new_call:
+        calls[key] += 1
+    if _stack:
+        _stack[-1][1] += elapsed
+
+
+def _profiled_steps(name, gen):
+    new_call = True
+    while True:
+        t0 = _enter(name)
+        try:
+            item = next(gen)
+        except StopIteration:
+            return
+        finally:
+            _exit(t0, new_call)
+            new_call = False
+        yield item
+
+
+def profiled(func):
+    name = func.__qualname__
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            return _profiled_steps(name, func(*args, **kwargs))
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t0 = _enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _exit(t0, True)
+
+    return wrapper
+
+
+def dump():
+    if path is None:
+        return
+    with open(path, 'w') as f:
+        for key, seconds in sorted(self_times.items()):
+            f.write(f"{key} {round(seconds * 1e6)}\n")
+    with open(path + '.calls', 'w') as f:
+        for key, n in sorted(calls.items()):
+            f.write(f"{key} {n}\n")
+
+
+if os.environ.get('IPC_PROFILE'):
+    enable(os.environ['IPC_PROFILE'])
@@ -0,0 +1,139 @@
+"""Regenerate the moves of some types in an existing crawl database.
+
+After fixing a generator, or adding a move, only its rows need redoing.
+The moves named and their inverses, which share rows with them, are
+deleted from the move table, and every explored curve generates just
+those moves again, in chunks spread over a NeighborPool. Neighbors not
+yet in the database are inserted unexplored, one past the curve that
+found them, for a --resume crawl to pick up.
+
+Moves of small curves come from the neighbor table only if it was
+built at the current curve_code.GENERATORS_VERSION, so bump that with
+the fix, and rebuild the table afterwards with neighbor_table.py.
+
+Each chunk is committed, and an interrupted run continues with
+--after ID, the last id it printed, without deleting again.
+
+    python recompute_moves.py ipc.db S_0_to_3_CCW S_1_to_2_CCW [--workers 4]
+"""
+import argparse
+import sqlite3
+import time
+
+import create_db
+from create_db import add_edge, iter_curves, load_counts, prepare_neighbors
+from curve_code import Curve, SphericalCurve, Move
+from neighbor_pool import NeighborPool
+
+
+def with_inverses(moves):
+    return {m for move in moves for m in (move, move.inverse())}
+
+
+def delete_moves(c, moves):
+    """Delete the rows of these moves and their inverses.
+
+    record_move() files a move under its adding type, or as found if the
+    crawl is symmetry reduced; deleting every type in the closure covers
+    both.
+    """
+    values = sorted(m.value for m in with_inverses(moves))
+    c.execute(f"""
+        DELETE FROM move WHERE type_id IN ({', '.join('?' * len(values))})
+    """, values)
+    return c.rowcount
+
+
+def _detect_mode(c):
+    """Set create_db's curve class and symmetry reduction from the rows."""
+    c.execute("SELECT whitney, symmetries FROM curve ORDER BY id LIMIT 1")
+    w, symmetries = c.fetchone()
+    create_db.curve_class = Curve if w is not None else SphericalCurve
+    create_db.symmetry_reduced = symmetries is not None
+
+
+def _explored_chunks(c, after, chunk_size):
+    """Yield lists of (id, distance, curve) of explored curves past an
+    id, in id order. Curves inserted meanwhile are unexplored, so they
+    are never included."""
+    while True:
+        c.execute("""
+            SELECT id FROM curve WHERE explored = 1 AND id > ?
+            ORDER BY id LIMIT ?
+        """, (after, chunk_size))
+        ids = [cid for (cid,) in c.fetchall()]
+        if not ids:
+            return
+        yield [(cid, d, curve) for cid, _, _, d, curve in iter_curves(
+            c, 'explored = 1 AND curve.id BETWEEN ? AND ?',
+            (ids[0], ids[-1]), create_db.curve_class)]
+        after = ids[-1]
+
+
+def recompute(c, moves, workers=1, chunk_size=1000, after=0, commit=None):
+    """Regenerate the moves in the set moves from every explored curve.
+
+    Moves are deleted first unless after, an id already reached by an
+    earlier run, is given. commit() is called after each chunk.
+    Returns (moves recorded, curves inserted).
+    """
+    moves = with_inverses(moves)
+    _detect_mode(c)
+    load_counts(c)
+    if not after:
+        print(f"deleted {delete_moves(c, moves)} rows")
+        if commit:
+            commit()
+
+    recorded = 0
+    misses = create_db.misses
+    pool = NeighborPool(workers, create_db.curve_class, moves=moves) \
+        if workers > 1 else None
+    try:
+        for chunk in _explored_chunks(c, after, chunk_size):
+            if pool is None:
+                found = ((cid, list(curve.neighbors(moves)))
+                         for cid, _, curve in chunk)
+            else:
+                found = ((cid, [(move, create_db.curve_class.unpack(code))
+                                for move, code in neighbors])
+                         for cid, neighbors in pool.imap(
+                             (cid, curve) for cid, _, curve in chunk))
+            for (cid, d, curve), (_, neighbors) in zip(chunk, found):
+                for move, c2, symmetry, symmetries in prepare_neighbors(
+                        neighbors):
+                    add_edge(c, curve, cid, move, c2, d + 1, symmetry,
+                             symmetries)
+                    recorded += 1
+            if commit:
+                commit()
+            print(f"{time.time() - create_db.start:.2f}  through id {chunk[-1][0]}: "
+                  f"{recorded} moves, {create_db.misses - misses} new curves")
+    finally:
+        if pool is not None:
+            pool.close()
+    return recorded, create_db.misses - misses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db')
+    parser.add_argument('moves', nargs='+', metavar='MOVE',
+                        help=f"names from {', '.join(m.name for m in Move)}")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--after', type=int, default=0,
+                        help='continue an interrupted run past this id')
+    args = parser.parse_args(argv)
+
+    try:
+        moves = {Move[name] for name in args.moves}
+    except KeyError as e:
+        parser.error(f"unknown move {e}")
+    conn = sqlite3.connect(args.db)
+    recompute(conn.cursor(), moves, args.workers, args.chunk_size,
+              args.after, conn.commit)
+
+
+if __name__ == '__main__':
+    main()
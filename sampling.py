@@ -0,0 +1,102 @@
+"""Sample curves with a given number of vertices by a random walk on moves.
+
+Each step proposes one of the current curve's neighbors() uniformly, so
+a neighbor y of x is proposed with probability m(x, y) / d(x), where m
+counts the moves from x to y and d(x) is the length of the neighbor list.
+Accepting with probability
+
+    min(1, m(y, x) d(x) / (m(x, y) d(y)))
+
+makes the chain's stationary distribution uniform over curves. Curves
+more than `window` vertices from n are rejected, and only curves with
+exactly n vertices are emitted. J moves change the vertex count by two,
+so a window below 2 leaves them out of the walk.
+"""
+import math
+import multiprocessing
+import os
+import random
+from collections import Counter
+
+from curve_code import Curve
+
+
+def _neighbor_keys(curve):
+    """(neighbors, Counter of their canonical keys)."""
+    neighbors = [c for _, c in curve.neighbors()]
+    return neighbors, Counter(c.canonical_key() for c in neighbors)
+
+
+def run_chain(n, count, seed, window=2, burn_in=1000, thin=10):
+    """Yield `count` samples from one chain."""
+    rng = random.Random(seed)
+    x = Curve.canonical(n + 1)
+    x_neighbors, x_keys = _neighbor_keys(x)
+    steps = 0
+    emitted = 0
+    while emitted < count:
+        steps += 1
+        y = rng.choice(x_neighbors)
+        if abs(y.num_vertices() - n) <= window:
+            y_neighbors, y_keys = _neighbor_keys(y)
+            forward = x_keys[y.canonical_key()]
+            backward = y_keys[x.canonical_key()]
+            ratio = (backward * len(x_neighbors)) / (forward * len(y_neighbors))
+            if rng.random() < ratio:
+                x, x_neighbors, x_keys = y, y_neighbors, y_keys
+
+        if steps > burn_in and steps % thin == 0 and x.num_vertices() == n:
+            emitted += 1
+            yield x
+
+
+def _chain_worker(queue, n, count, seed, window, burn_in, thin):
+    for c in run_chain(n, count, seed, window, burn_in, thin):
+        queue.put(list(c))
+    queue.put(None)
+
+
+def sample_curves(n, count, seed, chains=None, window=2, burn_in=1000,
+                  thin=10):
+    """Yield `count` curves with n vertices, drawn by parallel chains.
+
+    Each chain runs in its own process with its own seed derived from
+    `seed`, and samples are yielded as they arrive.
+    """
+    if chains is None:
+        chains = os.cpu_count() or 1
+    per_chain = math.ceil(count / chains)
+
+    queue = multiprocessing.Queue(maxsize=16 * chains)
+    workers = [
+        multiprocessing.Process(
+            target=_chain_worker,
+            args=(queue, n, per_chain, f"{seed}:{i}", window, burn_in, thin),
+            daemon=True,
+        )
+        for i in range(chains)
+    ]
+    for w in workers:
+        w.start()
+
+    try:
+        running = chains
+        emitted = 0
+        while running and emitted < count:
+            code = queue.get()
+            if code is None:
+                running -= 1
+            else:
+                emitted += 1
+                yield Curve(code)
+    finally:
+        for w in workers:
+            w.terminate()
+            w.join()
+
+
+if __name__ == '__main__':
+    import sys
+    n, count = int(sys.argv[1]), int(sys.argv[2])
+    for c in sample_curves(n, count, seed=0):
+        print(c)
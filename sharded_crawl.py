@@ -0,0 +1,327 @@
+"""A breadth first crawl split across shard databases.
+
+Each curve belongs to shard crc32(canonical_key) % K, and worker k keeps
+the curves of shard k in DIR/shard_k.db. Workers explore one distance at
+a time. A neighbor owned by another shard is appended to that shard's
+spool file for the next level, DIR/run_R/level_D/J_to_K.bin (in the
+binary format of transfer.py), and the move is kept in the remote_move
+table by the end curve's canonical key. When a worker has finished a
+level it writes DIR/run_R/level_D/done_J with the number of curves it
+produced; the next level starts once every shard is done, and the crawl
+stops when a level produces nothing or once level max_distance is
+explored. As with create_db.py --max-distance, curves one further are
+kept unexplored. A worker that fails writes DIR/run_R/failed_J, and the
+others stop at the next level instead of waiting for it.
+
+The run id R keeps the files of an earlier run in the same directory
+from passing for this one's. Only a shared directory is needed, so
+workers can be local processes or run on several machines, given the
+same new run id:
+
+    python sharded_crawl.py crawl DIR --shards 4 --max-distance 12
+    python sharded_crawl.py worker DIR SHARD --run R --shards 4 --max-distance 12
+    python sharded_crawl.py merge DIR ipc.db
+"""
+import argparse
+import glob
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+import zlib
+
+import create_db
+from create_db import (initialize, insert_curve, fetch_curve, add_edge,
+                       iter_curves, find_cid, record_move)
+from curve_code import Curve, Move
+import transfer
+
+remote_move_sql = '''
+CREATE TABLE remote_move (
+    start_curve_id INTEGER NOT NULL,
+    end_key BLOB NOT NULL, -- canonical_key() of the end curve
+    type_id INTEGER NOT NULL,
+    multiplicity INTEGER NOT NULL,
+
+    PRIMARY KEY (start_curve_id, end_key, type_id),
+    FOREIGN KEY (start_curve_id) REFERENCES curve (id)
+);
+'''
+
+
+def shard_of(key, shards):
+    return zlib.crc32(key) % shards
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f'shard_{shard}.db')
+
+
+def run_dir(directory, run):
+    return os.path.join(directory, f'run_{run}')
+
+
+def level_dir(directory, d):
+    return os.path.join(directory, f'level_{d}')
+
+
+class Spool:
+    """The spool files written by one shard for one level."""
+
+    def __init__(self, directory, shard, d):
+        self.path = level_dir(directory, d)
+        self.shard = shard
+        self.files = dict()
+        # keys already sent this level
+        self.sent = set()
+        os.makedirs(self.path, exist_ok=True)
+
+    def send(self, owner, key, curve, distance):
+        if key in self.sent:
+            return
+        self.sent.add(key)
+        if owner not in self.files:
+            f = open(os.path.join(self.path, f'{self.shard}_to_{owner}.bin'), 'wb')
+            f.write(transfer.MAGIC)
+            self.files[owner] = f
+        transfer.write_curve(self.files[owner], curve, None, distance)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def _mark_done(directory, shard, d, produced):
+    path = os.path.join(level_dir(directory, d), f'done_{shard}')
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(produced))
+    os.replace(path + '.tmp', path)
+
+
+def _wait_for_level(directory, shards, d, timeout=None, poll=0.1):
+    """Block until every shard has finished level d; return how many
+    curves they produced in it.
+
+    Raises RuntimeError if a shard has failed, or once timeout seconds
+    have passed, if given.
+    """
+    paths = [os.path.join(level_dir(directory, d), f'done_{k}')
+             for k in range(shards)]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not all(os.path.exists(p) for p in paths):
+        failed = glob.glob(os.path.join(directory, 'failed_*'))
+        if failed:
+            raise RuntimeError(f"{failed[0]} exists; stopping at level {d}")
+        if deadline is not None and time.monotonic() > deadline:
+            raise RuntimeError(f"level {d} not done after {timeout}s")
+        time.sleep(poll)
+    produced = 0
+    for path in paths:
+        with open(path) as f:
+            produced += int(f.read())
+    return produced
+
+
+def explore(c, cid, d, shard, shards, spool):
+    curve = fetch_curve(c, cid)
+    for move, c2 in curve.neighbors():
+        key = c2.canonical_key()
+        owner = shard_of(key, shards)
+        if owner == shard:
+            add_edge(c, curve, cid, move, c2, d + 1)
+            continue
+        spool.send(owner, key, c2, d + 1)
+        c.execute("""
+            INSERT INTO remote_move (start_curve_id, end_key, type_id,
+                                     multiplicity)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (start_curve_id, end_key, type_id)
+            DO UPDATE SET multiplicity = multiplicity + 1
+        """, (cid, key, move.value))
+    c.execute("""
+        UPDATE curve SET explored = 1 WHERE id = ?
+    """, (cid,))
+
+
+def run_worker(directory, shard, shards, max_distance, run, timeout=None):
+    """Crawl one shard, with the level files of run under directory."""
+    levels = run_dir(directory, run)
+    os.makedirs(levels, exist_ok=True)
+    try:
+        _run_worker(directory, levels, shard, shards, max_distance, timeout)
+    except BaseException as e:
+        with open(os.path.join(levels, f'failed_{shard}'), 'w') as f:
+            f.write(repr(e))
+        raise
+
+
+def _run_worker(directory, levels, shard, shards, max_distance, timeout):
+    conn = sqlite3.connect(shard_path(directory, shard))
+    c = conn.cursor()
+    initialize(c)
+    c.executescript(remote_move_sql)
+
+    start_curve = Curve(Curve.canonical(1))
+    if shard_of(start_curve.canonical_key(), shards) == shard:
+        insert_curve(c, start_curve, 0)
+
+    d = 0
+    while True:
+        for path in sorted(glob.glob(
+                os.path.join(level_dir(levels, d), f'*_to_{shard}.bin'))):
+            transfer.import_curves(c, path)
+        conn.commit()
+        if max_distance is not None and d > max_distance:
+            break
+
+        spool = Spool(levels, shard, d + 1)
+        c.execute("""
+            SELECT id FROM curve WHERE explored = 0 AND distance = ?
+            ORDER BY num_vertices, id
+        """, (d,))
+        for (cid,) in c.fetchall():
+            explore(c, cid, d, shard, shards, spool)
+        spool.close()
+        conn.commit()
+
+        c.execute("""
+            SELECT count(*) FROM curve WHERE explored = 0 AND distance = ?
+        """, (d + 1,))
+        (local,) = c.fetchone()
+        _mark_done(levels, shard, d + 1, local + len(spool.sent))
+        d += 1
+        if _wait_for_level(levels, shards, d, timeout) == 0:
+            break
+
+    conn.close()
+
+
+def crawl(directory, shards, max_distance):
+    """Run every shard's worker as a local process, in a new run.
+
+    If a worker exits with an error the others are terminated, and
+    RuntimeError is raised.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(run_dir(directory, '*')):
+        shutil.rmtree(path)
+    run = uuid.uuid4().hex[:8]
+    workers = [
+        multiprocessing.Process(target=run_worker,
+                                args=(directory, k, shards, max_distance, run))
+        for k in range(shards)
+    ]
+    for w in workers:
+        w.start()
+    try:
+        running = {w.sentinel: w for w in workers}
+        while running:
+            for sentinel in multiprocessing.connection.wait(running):
+                w = running.pop(sentinel)
+                w.join()
+                if w.exitcode:
+                    raise RuntimeError(
+                        f"shard worker {workers.index(w)} exited with "
+                        f"{w.exitcode}")
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+                w.join()
+
+
+def merge(directory, shards, c):
+    """Copy every shard into one database with fresh curve ids.
+
+    Local moves keep their rows; remote moves are resolved by key and
+    folded in with record_move().
+    """
+    initialize(c)
+    ids = []
+    for k in range(shards):
+        shard_c = sqlite3.connect(shard_path(directory, k)).cursor()
+        local_ids = dict()
+        explored = dict(shard_c.execute("SELECT id, explored FROM curve"))
+        for cid, _, _, d, curve in iter_curves(shard_c):
+            local_ids[cid] = insert_curve(c, curve, d)
+            c.execute("""
+                UPDATE curve SET explored = ? WHERE id = ?
+            """, (explored[cid], local_ids[cid]))
+        ids.append(local_ids)
+        shard_c.connection.close()
+
+    for k in range(shards):
+        shard_c = sqlite3.connect(shard_path(directory, k)).cursor()
+        shard_c.execute("""
+            SELECT start_curve_id, end_curve_id, type_id, multiplicity,
+                   inverse_multiplicity
+            FROM move
+        """)
+        c.executemany("""
+            INSERT INTO move (start_curve_id, end_curve_id, type_id,
+                              multiplicity, inverse_multiplicity)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (start_curve_id, end_curve_id, type_id, symmetry)
+            DO UPDATE SET
+                multiplicity = multiplicity + excluded.multiplicity,
+                inverse_multiplicity =
+                    inverse_multiplicity + excluded.inverse_multiplicity
+        """, ((ids[k][s], ids[k][e], t, m, im)
+              for s, e, t, m, im in shard_c.fetchall()))
+
+        shard_c.execute("""
+            SELECT start_curve_id, end_key, type_id, multiplicity
+            FROM remote_move
+        """)
+        for start_id, key, type_id, mult in shard_c.fetchall():
+            end_id = find_cid(c, Curve.unpack(key))
+            record_move(c, ids[k][start_id], end_id, Move(type_id), mult)
+        shard_c.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl_parser = commands.add_parser('crawl')
+    crawl_parser.add_argument('directory')
+
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('directory')
+    worker_parser.add_argument('shard', type=int)
+    worker_parser.add_argument('--run', required=True,
+                               help='an id new to DIR, the same for every '
+                                    'worker of the crawl')
+    worker_parser.add_argument('--level-timeout', type=float,
+                               help='seconds to wait for the other shards '
+                                    'to finish a level')
+
+    for p in (crawl_parser, worker_parser):
+        p.add_argument('--shards', type=int, required=True)
+        p.add_argument('--max-distance', type=int, default=None)
+
+    merge_parser = commands.add_parser('merge')
+    merge_parser.add_argument('directory')
+    merge_parser.add_argument('db')
+    merge_parser.add_argument('--shards', type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == 'crawl':
+        crawl(args.directory, args.shards, args.max_distance)
+    elif args.command == 'worker':
+        os.makedirs(args.directory, exist_ok=True)
+        run_worker(args.directory, args.shard, args.shards, args.max_distance,
+                   args.run, args.level_timeout)
+    else:
+        shards = args.shards or len(glob.glob(shard_path(args.directory, '*')))
+        conn = sqlite3.connect(args.db)
+        merge(args.directory, shards, conn.cursor())
+        conn.commit()
+        create_db.print_progress(conn.cursor())
+
+
+if __name__ == '__main__':
+    main()
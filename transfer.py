@@ -0,0 +1,151 @@
+"""Stream curves between crawl databases through compact files.
+
+The binary format is MAGIC followed by one record per curve: a RECORD
+header (key length in bytes, whitney, distance), little-endian, and the
+curve's dense_key() (see face_codec.py), which reads the same on any
+machine.
+The JSON lines format has one {"code", "whitney", "distance"} object per
+line. Both are read and written one curve at a time.
+
+    python transfer.py export ipc.db curves.bin [--num-vertices 6] [--jsonl]
+    python transfer.py import ipc.db curves.bin [more.bin ...]
+
+Importing into a database that does not exist yet creates it.
+"""
+import argparse
+import json
+import sqlite3
+import struct
+
+from curve_code import Curve
+from create_db import (iter_curves, find_cid, initialize, insert_curve,
+                       load_counts, lower_distance)
+
+MAGIC = b'IPCCURV2'
+RECORD = struct.Struct('<Iii')
+# stored in place of a NULL whitney index
+NO_WHITNEY = -2 ** 31
+
+
+def _condition(filters):
+    clauses = []
+    params = []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(value, tuple):
+            clauses.append(f"{column} BETWEEN ? AND ?")
+            params.extend(value)
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return ' AND '.join(clauses) or '1', params
+
+
+def write_curve(f, curve, whitney, distance):
+    """Append one record to a binary file opened after its MAGIC."""
+    key = curve.dense_key()
+    f.write(RECORD.pack(
+        len(key), NO_WHITNEY if whitney is None else whitney, distance))
+    f.write(key)
+
+
+def export_curves(c, path, jsonl=False, num_vertices=None, whitney=None,
+                  distance=None):
+    """Write the matching curves to path; return how many were written.
+
+    Each filter is a value, a (low, high) range, or None for any.
+    """
+    condition, params = _condition({
+        'num_vertices': num_vertices,
+        'whitney': whitney,
+        'distance': distance,
+    })
+    written = 0
+    with open(path, 'w' if jsonl else 'wb') as f:
+        if not jsonl:
+            f.write(MAGIC)
+        for _, _, w, d, curve in iter_curves(c, condition, params):
+            if jsonl:
+                f.write(json.dumps({
+                    'code': list(curve), 'whitney': w, 'distance': d,
+                }) + '\n')
+            else:
+                write_curve(f, curve, w, d)
+            written += 1
+    return written
+
+
+def read_curves(path):
+    """Yield (curve, whitney, distance) from a file in either format."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            for line in f:
+                record = json.loads(line)
+                yield Curve(record['code']), record['whitney'], record['distance']
+            return
+
+        while True:
+            header = f.read(RECORD.size)
+            if not header:
+                return
+            length, w, d = RECORD.unpack(header)
+            yield (Curve.from_dense_key(f.read(length)),
+                   None if w == NO_WHITNEY else w, d)
+
+
+def import_curves(c, path):
+    """Merge the curves in path into the database.
+
+    New curves are inserted unexplored. Curves already present keep
+    their row, taking the smaller distance. Returns (inserted, merged).
+    """
+    load_counts(c)
+    inserted = merged = 0
+    for curve, _, d in read_curves(path):
+        cid = find_cid(c, curve)
+        if cid is None:
+            insert_curve(c, curve, d)
+            inserted += 1
+        else:
+            lower_distance(c, cid, d)
+            merged += 1
+    return inserted, merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export')
+    export.add_argument('db')
+    export.add_argument('path')
+    export.add_argument('--jsonl', action='store_true')
+    for name in ('--num-vertices', '--whitney', '--distance'):
+        export.add_argument(name, type=int)
+
+    import_ = commands.add_parser('import')
+    import_.add_argument('db')
+    import_.add_argument('paths', nargs='+')
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    c = conn.cursor()
+    if args.command == 'import':
+        c.execute("SELECT 1 FROM sqlite_master WHERE name = 'curve'")
+        if c.fetchone() is None:
+            initialize(c)
+    if args.command == 'export':
+        n = export_curves(c, args.path, args.jsonl, args.num_vertices,
+                          args.whitney, args.distance)
+        print(f"exported {n} curves")
+    else:
+        for path in args.paths:
+            inserted, merged = import_curves(c, path)
+            conn.commit()
+            print(f"{path}: {inserted} new, {merged} already present")
+
+
+if __name__ == '__main__':
+    main()
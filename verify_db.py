@@ -0,0 +1,142 @@
+"""Check every curve and move in a crawl database.
+
+Curves are streamed in chunks to a process pool, which checks each code
+with Curve._check_invariants() and the Gauss code planarity test, and
+checks the stored hash, num_vertices and whitney against the code. Rows
+with a NULL whitney are read as SphericalCurve. The checks are asserts,
+so don't run this with python -O.
+
+Moves are checked in SQL: both ends must exist, and a move between two
+explored curves must have been found in both directions. Symmetry
+reduced crawls store moves as found, so only the first holds there.
+
+    python verify_db.py ipc.db [--processes 8] [--chunk-size 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+from collections import deque
+from itertools import groupby, islice
+
+from curve_code import Curve, SphericalCurve
+from gauss_code_planarity import planar
+
+
+def check_curve(cid, stored_hash, v, w, code):
+    """The problems found with one curve row, as strings."""
+    curve = (Curve if w is not None else SphericalCurve)(code)
+    problems = []
+    if len(curve) == 1:
+        pair = code[0]
+        if Curve.OUT not in pair or pair == (Curve.OUT, Curve.OUT):
+            problems.append(f"invalid one edge code {pair}")
+    else:
+        try:
+            if len(curve) % 2:
+                raise AssertionError("odd length")
+            curve._check_invariants()
+            assert planar(curve.gauss_code()), "not planar"
+        except AssertionError as e:
+            problems.append(f"invalid code: {str(e) or 'invariant failed'}")
+            return problems
+
+    if v != curve.num_vertices():
+        problems.append(f"num_vertices {v}, code has {curve.num_vertices()}")
+    if w is not None and w != curve.whitney():
+        problems.append(f"whitney {w}, code has {curve.whitney()}")
+    if stored_hash != hash(curve):
+        problems.append(f"hash {stored_hash}, code has {hash(curve)}")
+    return problems
+
+
+def check_chunk(rows):
+    return [(cid, problem)
+            for cid, *row in rows
+            for problem in check_curve(cid, *row)]
+
+
+def curve_rows(c):
+    c.execute("""
+        SELECT curve.id, hash, num_vertices, whitney, left_face, right_face
+        FROM curve JOIN curve_edge ON curve_edge.curve_id = curve.id
+        ORDER BY curve.id, position
+    """)
+    for (cid, h, v, w), rows in groupby(c, key=lambda row: row[:4]):
+        yield cid, h, v, w, [row[4:] for row in rows]
+
+
+def verify_curves(c, processes=None, chunk_size=2000):
+    """Yield (curve id, problem) for each failed curve check."""
+    rows = curve_rows(c)
+    with multiprocessing.Pool(processes) as pool:
+        # Bound the chunks in flight so the database is read no faster
+        # than the pool checks it.
+        pending = deque()
+        limit = 2 * (processes or os.cpu_count())
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if chunk:
+                pending.append(pool.apply_async(check_chunk, (chunk,)))
+            while pending and (len(pending) >= limit or not chunk):
+                yield from pending.popleft().get()
+            if not chunk:
+                return
+
+
+def verify_moves(c):
+    """Yield (description, row) for each failed move check."""
+    c.execute("""
+        SELECT move.*
+        FROM move
+        LEFT JOIN curve s ON s.id = start_curve_id
+        LEFT JOIN curve e ON e.id = end_curve_id
+        WHERE s.id IS NULL OR e.id IS NULL
+    """)
+    for row in c.fetchall():
+        yield "move to or from a missing curve", row
+
+    c.execute("SELECT count(*) FROM curve WHERE symmetries IS NOT NULL")
+    if c.fetchone()[0]:
+        return
+
+    c.execute("SELECT * FROM move WHERE type_id % 2 = 0")
+    for row in c.fetchall():
+        yield "move stored under its inverse type", row
+
+    c.execute("""
+        SELECT move.*
+        FROM move
+        JOIN curve s ON s.id = start_curve_id
+        JOIN curve e ON e.id = end_curve_id
+        WHERE s.explored AND e.explored
+        AND (multiplicity = 0 OR inverse_multiplicity = 0)
+    """)
+    for row in c.fetchall():
+        yield "move between explored curves found one way only", row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    failures = 0
+    for cid, problem in verify_curves(conn.cursor(), args.processes,
+                                      args.chunk_size):
+        print(f"curve {cid}: {problem}")
+        failures += 1
+    for problem, row in verify_moves(conn.cursor()):
+        print(f"{problem}: {row}")
+        failures += 1
+
+    print(f"{failures} problems found")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())